@@ -14,18 +14,53 @@ SETUP INSTRUCTIONS:
    - Or run "python main.py" in the Shell
 
 The bot will start using long polling (no webhooks needed).
+For lower latency it can instead receive updates on a webhook:
+    python main.py --mode webhook --port 8080
 """
 
 import os
+import argparse
 import asyncio
+import calendar
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import secrets
+import shutil
+import signal
 import sqlite3
-from datetime import datetime
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 
-from typing import Union
+from functools import lru_cache, partial
+from operator import itemgetter
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, Union
 from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import EditMessageText
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+try:
+    import numpy as np
+except ImportError:  # analytics fall back to plain Python loops
+    np = None
 
 ALLOWED_USERS = {"dkokhel", "nangsihalath"}
 
@@ -38,30 +73,387 @@ class AccessMiddleware(BaseMiddleware):
     async def __call__(
         self,
         handler,
-        event: Union[types.Message, types.CallbackQuery],
+        event: Union[types.Update, types.Message, types.CallbackQuery],
         data: dict
     ):
-        user = getattr(event, "from_user", None)
+        # Registered on updates, so the user comes from aiogram's context data
+        user = data.get("event_from_user")
 
         # если нет пользователя (какой-то системный апдейт) — пропускаем
         if user is None:
             return await handler(event, data)
 
         if not is_allowed_user(user):
+            if isinstance(event, types.Update):
+                event = event.event
             # сообщение
             if isinstance(event, types.Message):
                 await event.answer("❌ Access denied")
             # нажатия на кнопки
             elif isinstance(event, types.CallbackQuery):
                 await event.answer("❌ Access denied", show_alert=True)
+            # inline-поиск: пустой результат
+            elif isinstance(event, types.InlineQuery):
+                await event.answer([], cache_time=0, is_personal=True)
             return
 
         # всё ок — пускаем дальше
         return await handler(event, data)
 
+# ============================================================================
+# PER-USER ORDERING
+# ============================================================================
+class UserOrderingMiddleware(BaseMiddleware):
+    """Handle each user's updates one at a time, in arrival order.
+
+    Polling runs every update as its own task, so different cashiers are
+    served concurrently. A per-user lock (asyncio.Lock wakes waiters FIFO)
+    keeps a quick `size:` then `pay:` double tap from racing on the same
+    session. Locks are dropped once nobody is waiting on them.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._waiting = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def __call__(self, handler, event: types.Update, data: dict):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        user_id = user.id
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        self._waiting[user_id] = self._waiting.get(user_id, 0) + 1
+        try:
+            async with lock:
+                return await handler(event, data)
+        finally:
+            self._waiting[user_id] -= 1
+            if not self._waiting[user_id]:
+                del self._waiting[user_id]
+                del self._locks[user_id]
+
+# ============================================================================
+# OUTBOUND TELEGRAM REQUESTS
+# ============================================================================
+# Telegram allows about 30 messages per second overall and about one per
+# second per chat (short bursts are tolerated). Requests that target a chat
+# are paced with token buckets; callback answers are not limited.
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', '5'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+OUTBOUND_MAX_RETRY_AFTER = int(os.getenv('OUTBOUND_MAX_RETRY_AFTER', '60'))
+OUTBOUND_TRACKED_MESSAGES = 1000
+
+class TokenBucket:
+    """Reserve send slots at `rate` per second with up to `burst` at once."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0  # set by a RetryAfter from Telegram
+
+    def reserve(self, now: float) -> float:
+        """Take a slot and return how long to wait before using it."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= 1  # may go negative: later callers queue behind this one
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Bot session middleware that paces, retries and trims outgoing requests.
+
+    - waits for the per-chat and global rate limits before sending;
+    - honours RetryAfter by pausing the chat and retrying;
+    - treats "message is not modified" as success;
+    - skips edits identical to what the message already shows, and when
+      several edits of one message are waiting, sends only the latest.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: int = OUTBOUND_CHAT_BURST, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chats = {}  # chat id -> TokenBucket
+        self._shown = OrderedDict()  # (chat id, message id) -> (text, markup) last sent
+        self._pending_edits = {}  # (chat id, message id) -> [latest method, future]
+        self.skipped = 0
+        self.coalesced = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        if not isinstance(method, EditMessageText) or method.message_id is None:
+            return await self._send(make_request, bot, method, chat_id)
+
+        key = (chat_id, method.message_id)
+        if self._shown.get(key) == self._content(method):
+            self.skipped += 1
+            return True
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # An older edit of this message has not gone out yet: replace it
+            pending[0] = method
+            self.coalesced += 1
+            return await asyncio.shield(pending[1])
+
+        entry = self._pending_edits[key] = [method, asyncio.get_running_loop().create_future()]
+        try:
+            await self._wait_turn(chat_id)
+        finally:
+            del self._pending_edits[key]
+        method, future = entry
+        try:
+            if self._shown.get(key) == self._content(method):
+                self.skipped += 1
+                result = True
+            else:
+                result = await self._send(make_request, bot, method, chat_id, waited=True)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # only coalesced callers care; don't warn if there are none
+            raise
+        future.set_result(result)
+        return result
+
+    @staticmethod
+    def _content(method):
+        markup = method.reply_markup
+        return method.text, markup.model_dump_json(exclude_none=True) if markup is not None else None
+
+    def _remember(self, chat_id, method, result):
+        """Note what a message now shows, for sent messages and edits."""
+        if isinstance(method, EditMessageText):
+            message_id = method.message_id
+        elif isinstance(result, types.Message) and hasattr(method, "text"):
+            message_id = result.message_id
+        else:
+            return
+        key = (chat_id, message_id)
+        self._shown[key] = self._content(method)
+        self._shown.move_to_end(key)
+        if len(self._shown) > OUTBOUND_TRACKED_MESSAGES:
+            self._shown.popitem(last=False)
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _wait_turn(self, chat_id):
+        now = time.monotonic()
+        delay = max(self._bucket(chat_id).reserve(now), self.global_bucket.reserve(now))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, make_request, bot, method, chat_id, waited=False):
+        for attempt in range(self.max_retries + 1):
+            if not waited:
+                await self._wait_turn(chat_id)
+            waited = False
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries or e.retry_after > OUTBOUND_MAX_RETRY_AFTER:
+                    raise
+                print(f"⏳ Flood control in chat {chat_id}, retrying in {e.retry_after}s")
+                self._bucket(chat_id).paused_until = time.monotonic() + e.retry_after
+                continue
+            except TelegramBadRequest as e:
+                if "message is not modified" not in e.message:
+                    raise
+                result = True
+            self._remember(chat_id, method, result)
+            return result
+
+# ============================================================================
+# METRICS
+# ============================================================================
+# Every update is timed by route (callback key, callback prefix or command),
+# with the part spent in SQLite measured separately. Latencies go into
+# fixed-bucket histograms, so memory stays bounded no matter how busy the
+# shop is: one set of lifetime counters per route for Prometheus, plus
+# per-minute histograms for the last METRICS_WINDOW_MINUTES shown by /stats.
+METRICS_WINDOW_MINUTES = int(os.getenv('METRICS_WINDOW_MINUTES', '15'))
+SLOW_UPDATE_MS = float(os.getenv('SLOW_UPDATE_MS', '500'))
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 = no Prometheus endpoint
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Seconds spent in SQLite by the current update (a one-item list, or None
+# outside an update); SalesRepository adds to it.
+update_db_time = ContextVar("update_db_time", default=None)
+
+class LatencyHistogram:
+    """Update count, total time, SQLite time and bucketed latencies."""
+    __slots__ = ("buckets", "count", "total", "db_total")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.db_total = 0.0
+
+    def observe(self, seconds: float, db_seconds: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.db_total += db_seconds
+
+    def merge(self, other: "LatencyHistogram"):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.db_total += other.db_total
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, in seconds."""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class UpdateMetrics:
+    """Lifetime and rolling latency histograms per route."""
+
+    def __init__(self, window_minutes: int = METRICS_WINDOW_MINUTES):
+        self.lifetime = {}  # route -> LatencyHistogram
+        self._minutes = deque(maxlen=window_minutes)  # (minute, {route: LatencyHistogram})
+        self.slow = 0
+
+    def observe(self, route: str, seconds: float, db_seconds: float):
+        histogram = self.lifetime.get(route)
+        if histogram is None:
+            histogram = self.lifetime[route] = LatencyHistogram()
+        histogram.observe(seconds, db_seconds)
+
+        minute = int(time.time() // 60)
+        if not self._minutes or self._minutes[-1][0] != minute:
+            self._minutes.append((minute, {}))
+        recent = self._minutes[-1][1]
+        histogram = recent.get(route)
+        if histogram is None:
+            histogram = recent[route] = LatencyHistogram()
+        histogram.observe(seconds, db_seconds)
+
+    def recent(self):
+        """Histograms per route merged over the rolling window."""
+        oldest = int(time.time() // 60) - self._minutes.maxlen
+        merged = {}
+        for minute, routes in self._minutes:
+            if minute <= oldest:
+                continue
+            for route, histogram in routes.items():
+                merged.setdefault(route, LatencyHistogram()).merge(histogram)
+        return merged
+
+    def prometheus_text(self) -> str:
+        """Lifetime counters in the Prometheus text exposition format."""
+        lines = [
+            "# HELP bot_update_duration_seconds Time to handle one Telegram update.",
+            "# TYPE bot_update_duration_seconds histogram",
+        ]
+        for route, histogram in sorted(self.lifetime.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), histogram.buckets):
+                cumulative += n
+                lines.append(f'bot_update_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+            lines.append(f'bot_update_duration_seconds_sum{{route="{route}"}} {histogram.total:.6f}')
+            lines.append(f'bot_update_duration_seconds_count{{route="{route}"}} {histogram.count}')
+        lines += [
+            "# HELP bot_update_db_seconds_total Time spent in SQLite while handling updates.",
+            "# TYPE bot_update_db_seconds_total counter",
+        ]
+        for route, histogram in sorted(self.lifetime.items()):
+            lines.append(f'bot_update_db_seconds_total{{route="{route}"}} {histogram.db_total:.6f}')
+        lines += [
+            "# HELP bot_slow_updates_total Updates slower than SLOW_UPDATE_MS.",
+            "# TYPE bot_slow_updates_total counter",
+            f"bot_slow_updates_total {self.slow}",
+            "# HELP bot_report_cache_lookups_total Report cache lookups by result.",
+            "# TYPE bot_report_cache_lookups_total counter",
+            f'bot_report_cache_lookups_total{{result="hit"}} {report_cache.hits}',
+            f'bot_report_cache_lookups_total{{result="miss"}} {report_cache.misses}',
+        ]
+        return "\n".join(lines) + "\n"
+
+update_metrics = UpdateMetrics()
+
+def update_route(update: types.Update) -> str:
+    """Route label of an update; only known routes, so labels stay few."""
+    if update.callback_query is not None:
+        data = update.callback_query.data or ""
+        if data in CALLBACK_ROUTES:
+            return data
+        prefix = data.split(":", 1)[0]
+        return f"{prefix}:*" if prefix in PREFIX_ROUTES else "callback:unknown"
+    if update.message is not None:
+        text = update.message.text or ""
+        if text.startswith("/"):
+            parts = text[1:].split()
+            command = parts[0].split("@")[0].lower() if parts else ""
+            if command in COMMANDS:
+                return f"/{command}"
+        return "message"
+    return update.event_type
+
+class MetricsMiddleware(BaseMiddleware):
+    """Time each update and log the slow ones."""
+
+    def __init__(self, metrics: UpdateMetrics = update_metrics, slow_ms: float = SLOW_UPDATE_MS):
+        self.metrics = metrics
+        self.slow_ms = slow_ms
+
+    async def __call__(self, handler, event: types.Update, data: dict):
+        db_time = [0.0]
+        token = update_db_time.set(db_time)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            update_db_time.reset(token)
+            route = update_route(event)
+            self.metrics.observe(route, elapsed, db_time[0])
+            if elapsed * 1000 >= self.slow_ms:
+                self.metrics.slow += 1
+                print(f"🐢 Slow update {route}: {elapsed * 1000:.0f} ms "
+                      f"(SQLite {db_time[0] * 1000:.0f} ms)")
+
+async def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """Serve /metrics for Prometheus on a local port; returns the runner to clean up."""
+    async def metrics(request):
+        return web.Response(text=update_metrics.prometheus_text(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics")
+    return runner
+
 # ============================================================================
 # ADMIN HELPER
 # ============================================================================
+ADMIN_ONLY_TEXT = "คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only"
+
 def is_admin_user(user: types.User) -> bool:
     """Check if user is an admin"""
     admins = {"dkokhel", "nangsihalath"}
@@ -134,9 +526,585 @@ MENU = {
 # ============================================================================
 # DATABASE SETUP
 # ============================================================================
+DB_PATH = os.getenv('SALES_DB_PATH', '/data/sales.db')
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_STATEMENT_CACHE = 128
+
+class ConnectionManager:
+    """Long-lived SQLite connections, one per DB worker thread.
+
+    The writer thread and every reader thread each keep their own connection
+    open for the life of the bot, so a sale or a report no longer pays for
+    opening the file and parsing the schema. With WAL journaling readers work
+    from a snapshot and never block the writer recording a sale.
+    """
+
+    def __init__(self):
+        self.path = None
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def configure(self, path: str):
+        self.close()
+        self.path = path
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.path is None:
+                raise RuntimeError("init_database() has not been called")
+            conn = sqlite3.connect(
+                self.path,
+                timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                cached_statements=DB_STATEMENT_CACHE,
+                uri=True,  # lets ATTACH open archives read-only; plain paths still work
+                check_same_thread=False,  # only closed from another thread, at shutdown
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close every connection. Call only after the DB workers have stopped."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+db_pool = ConnectionManager()
+
+# ---------- time helpers ----------
+# `ts` columns hold shop wall-clock time as seconds since 1970-01-01, i.e. the
+# same value SQLite's strftime('%s', datetime) gives for the `datetime` text.
+# Rollup `day` columns hold ts // 86400.
+def to_ts(moment: datetime) -> int:
+    """Convert a naive local datetime to a wall-clock epoch."""
+    return calendar.timegm(moment.timetuple())
+
+def date_to_day(date: str) -> int:
+    """Convert YYYY-MM-DD to a day number (days since 1970-01-01)."""
+    return to_ts(datetime.strptime(date, "%Y-%m-%d")) // 86400
+
+def day_to_date(day: int) -> str:
+    """Convert a day number back to YYYY-MM-DD."""
+    return (datetime(1970, 1, 1) + timedelta(days=day)).strftime("%Y-%m-%d")
+
+def to_satang(price) -> int:
+    """Convert a baht amount to integer satang (1/100 baht)."""
+    return int(round(price * 100))
+
+# ---------- schema migrations ----------
+# Applied in order on top of the original `sales` table; PRAGMA user_version
+# records how many have run.
+def _migrate_sale_ts_index(conn):
+    """Numeric sale time with an index so reports are range scans, not full scans."""
+    conn.execute("ALTER TABLE sales ADD COLUMN ts INTEGER")
+    conn.execute("UPDATE sales SET ts = CAST(strftime('%s', datetime) AS INTEGER)")
+    conn.execute("CREATE INDEX idx_sales_ts ON sales(ts)")
+
+def _migrate_daily_summary(conn):
+    """Daily rollup by drink and payment type, backfilled from existing sales."""
+    conn.execute('''
+        CREATE TABLE daily_sales_summary (
+            day TEXT NOT NULL,
+            drink_name TEXT NOT NULL,
+            payment_type TEXT NOT NULL,
+            cups INTEGER NOT NULL,
+            revenue REAL NOT NULL,
+            PRIMARY KEY (day, drink_name, payment_type)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO daily_sales_summary (day, drink_name, payment_type, cups, revenue)
+        SELECT
+            substr(datetime, 1, 10),
+            drink_name,
+            payment_type,
+            SUM(CASE WHEN category != 'ท็อปปิ้ง / Toppings' THEN 1 ELSE 0 END),
+            SUM(price)
+        FROM sales
+        GROUP BY 1, 2, 3
+    ''')
+
+def _migrate_meta(conn):
+    """Key/value table for bookkeeping such as the write-behind journal position."""
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID")
+
+def _migrate_normalized_sales(conn):
+    """Dimension tables, integer-keyed sales facts and integer satang amounts."""
+    conn.execute('''
+        CREATE TABLE categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            is_topping INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE drinks (
+            id INTEGER PRIMARY KEY,
+            category_id INTEGER NOT NULL REFERENCES categories (id),
+            name TEXT NOT NULL,
+            UNIQUE (category_id, name)
+        )
+    ''')
+    conn.execute("CREATE TABLE sizes (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    conn.execute("CREATE TABLE payment_types (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+
+    # Seed from MENU first so ids follow menu order, then pick up anything
+    # older sales refer to that is no longer on the menu.
+    sync_dimensions(conn)
+    conn.execute('''
+        INSERT OR IGNORE INTO categories (name, is_topping)
+        SELECT DISTINCT category, category = 'ท็อปปิ้ง / Toppings' FROM sales
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO drinks (category_id, name)
+        SELECT DISTINCT c.id, s.drink_name FROM sales s JOIN categories c ON c.name = s.category
+    ''')
+    conn.execute("INSERT OR IGNORE INTO sizes (name) SELECT DISTINCT size FROM sales")
+    conn.execute("INSERT OR IGNORE INTO payment_types (name) SELECT DISTINCT payment_type FROM sales")
+
+    conn.execute("ALTER TABLE sales RENAME TO sales_v1")
+    conn.execute("DROP INDEX idx_sales_ts")
+    conn.execute('''
+        CREATE TABLE sales (
+            id INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            drink_id INTEGER NOT NULL REFERENCES drinks (id),
+            size_id INTEGER NOT NULL REFERENCES sizes (id),
+            payment_id INTEGER NOT NULL REFERENCES payment_types (id),
+            amount INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO sales (id, ts, drink_id, size_id, payment_id, amount)
+        SELECT s.id, s.ts, d.id, z.id, p.id, CAST(ROUND(s.price * 100) AS INTEGER)
+        FROM sales_v1 s
+        JOIN categories c ON c.name = s.category
+        JOIN drinks d ON d.category_id = c.id AND d.name = s.drink_name
+        JOIN sizes z ON z.name = s.size
+        JOIN payment_types p ON p.name = s.payment_type
+        ORDER BY s.id
+    ''')
+    conn.execute("DROP TABLE sales_v1")
+    conn.execute("CREATE INDEX idx_sales_ts ON sales (ts)")
+
+    conn.execute("DROP TABLE daily_sales_summary")
+    conn.execute('''
+        CREATE TABLE daily_sales_summary (
+            day INTEGER NOT NULL,
+            drink_id INTEGER NOT NULL,
+            payment_id INTEGER NOT NULL,
+            cups INTEGER NOT NULL,
+            revenue INTEGER NOT NULL,
+            PRIMARY KEY (day, drink_id, payment_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO daily_sales_summary (day, drink_id, payment_id, cups, revenue)
+        SELECT s.ts / 86400, s.drink_id, s.payment_id, SUM(NOT c.is_topping), SUM(s.amount)
+        FROM sales s
+        JOIN drinks d ON d.id = s.drink_id
+        JOIN categories c ON c.id = d.category_id
+        GROUP BY 1, 2, 3
+    ''')
+
+def _migrate_sessions(conn):
+    """Persisted in-progress sales (used with SESSION_PERSIST=1)."""
+    conn.execute('''
+        CREATE TABLE sessions (
+            user_id INTEGER PRIMARY KEY,
+            category INTEGER,
+            drink INTEGER,
+            size INTEGER,
+            price REAL,
+            touched REAL NOT NULL
+        )
+    ''')
+
+def _migrate_sale_keys(conn):
+    """Idempotency key per sale, so a retried or double-tapped payment is stored once."""
+    conn.execute("ALTER TABLE sales ADD COLUMN sale_key TEXT")
+    conn.execute("CREATE UNIQUE INDEX idx_sales_sale_key ON sales (sale_key) WHERE sale_key IS NOT NULL")
+    conn.execute("ALTER TABLE sessions ADD COLUMN sale_key TEXT")
+
+def _migrate_orders(conn):
+    """Multi-item orders: an order header per payment, its sales lines point back to it."""
+    conn.execute('''
+        CREATE TABLE orders (
+            id INTEGER PRIMARY KEY,
+            order_key TEXT NOT NULL UNIQUE,
+            ts INTEGER NOT NULL,
+            payment_id INTEGER NOT NULL REFERENCES payment_types (id),
+            amount INTEGER NOT NULL,
+            lines INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("ALTER TABLE sales ADD COLUMN order_id INTEGER REFERENCES orders (id)")
+    conn.execute("ALTER TABLE sales ADD COLUMN order_item INTEGER")  # drink number; its toppings share it
+    # Sessions now hold a cart; sales in progress at upgrade time are dropped
+    conn.execute("DROP TABLE sessions")
+    conn.execute('''
+        CREATE TABLE sessions (
+            user_id INTEGER PRIMARY KEY,
+            category INTEGER,
+            drink INTEGER,
+            items TEXT NOT NULL,
+            touched REAL NOT NULL,
+            sale_key TEXT
+        )
+    ''')
+
+def _migrate_partitions(conn):
+    """Sale and order ids that are never reused (old rows move to archives), and the archive catalog."""
+    # Rebuilt with AUTOINCREMENT: without it SQLite may hand out an archived
+    # row's id again once newer rows are gone. Orders first, so the new
+    # sales table references the new orders table.
+    conn.execute("ALTER TABLE orders RENAME TO orders_v7")
+    conn.execute('''
+        CREATE TABLE orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_key TEXT NOT NULL UNIQUE,
+            ts INTEGER NOT NULL,
+            payment_id INTEGER NOT NULL REFERENCES payment_types (id),
+            amount INTEGER NOT NULL,
+            lines INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO orders SELECT id, order_key, ts, payment_id, amount, lines FROM orders_v7")
+    conn.execute("DROP TABLE orders_v7")
+
+    conn.execute("ALTER TABLE sales RENAME TO sales_v7")
+    conn.execute("DROP INDEX idx_sales_ts")
+    conn.execute("DROP INDEX idx_sales_sale_key")
+    conn.execute('''
+        CREATE TABLE sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            drink_id INTEGER NOT NULL REFERENCES drinks (id),
+            size_id INTEGER NOT NULL REFERENCES sizes (id),
+            payment_id INTEGER NOT NULL REFERENCES payment_types (id),
+            amount INTEGER NOT NULL,
+            sale_key TEXT,
+            order_id INTEGER REFERENCES orders (id),
+            order_item INTEGER
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO sales (id, ts, drink_id, size_id, payment_id, amount, sale_key, order_id, order_item)
+        SELECT id, ts, drink_id, size_id, payment_id, amount, sale_key, order_id, order_item FROM sales_v7
+    ''')
+    conn.execute("DROP TABLE sales_v7")
+    conn.execute("CREATE INDEX idx_sales_ts ON sales (ts)")
+    conn.execute("CREATE UNIQUE INDEX idx_sales_sale_key ON sales (sale_key) WHERE sale_key IS NOT NULL")
+
+    conn.execute('''
+        CREATE TABLE partitions (
+            month TEXT PRIMARY KEY,
+            file TEXT NOT NULL,
+            first_ts INTEGER NOT NULL,
+            last_ts INTEGER NOT NULL,
+            sales INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            archived_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+MIGRATIONS = [
+    _migrate_sale_ts_index,
+    _migrate_daily_summary,
+    _migrate_meta,
+    _migrate_normalized_sales,
+    _migrate_sessions,
+    _migrate_sale_keys,
+    _migrate_orders,
+    _migrate_partitions,
+]
+
+def migrate_database(conn):
+    """Bring the schema up to date, one transaction per migration."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN")  # sqlite3 would not open one for DDL on its own
+        with conn:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        print(f"✅ Database migrated to v{number}: {migration.__doc__}")
+
+# ---------- dimensions ----------
+TOPPINGS_CATEGORY = "ท็อปปิ้ง / Toppings"
+PAYMENT_TYPES = ("cash", "qr")
+
+def sync_dimensions(conn):
+    """Add any MENU category, drink, size or payment type missing from the dimension tables."""
+    for category, drinks in MENU.items():
+        conn.execute(
+            "INSERT OR IGNORE INTO categories (name, is_topping) VALUES (?, ?)",
+            (category, int(category == TOPPINGS_CATEGORY)),
+        )
+        category_id = conn.execute("SELECT id FROM categories WHERE name = ?", (category,)).fetchone()[0]
+        for drink, sizes in drinks.items():
+            conn.execute("INSERT OR IGNORE INTO drinks (category_id, name) VALUES (?, ?)", (category_id, drink))
+            for size in sizes:
+                conn.execute("INSERT OR IGNORE INTO sizes (name) VALUES (?)", (size,))
+    for payment_type in PAYMENT_TYPES:
+        conn.execute("INSERT OR IGNORE INTO payment_types (name) VALUES (?)", (payment_type,))
+
+class Dimensions:
+    """In-memory name <-> id maps of the dimension tables.
+
+    Only the DB writer thread adds entries, inside transaction(); readers
+    just look ids up.
+    """
+
+    def __init__(self):
+        self.categories = {}   # name -> id
+        self.drinks = {}       # (category name, drink name) -> id
+        self.sizes = {}        # name -> id
+        self.payment_types = {}
+        self.cup_drinks = set()  # drink ids that count as a cup (not toppings)
+        self.drink_names = {}  # drink id -> name
+        self._added = []  # (map, key) added in the open transaction
+
+    def load(self, conn):
+        self.categories = dict(conn.execute("SELECT name, id FROM categories"))
+        self.drinks = {
+            (category, drink): drink_id
+            for drink_id, drink, category in conn.execute(
+                "SELECT d.id, d.name, c.name FROM drinks d JOIN categories c ON c.id = d.category_id"
+            )
+        }
+        self.drink_names = {drink_id: drink for (_, drink), drink_id in self.drinks.items()}
+        self.sizes = dict(conn.execute("SELECT name, id FROM sizes"))
+        self.payment_types = dict(conn.execute("SELECT name, id FROM payment_types"))
+        self.cup_drinks = {
+            drink_id for (drink_id,) in conn.execute(
+                "SELECT d.id FROM drinks d JOIN categories c ON c.id = d.category_id WHERE NOT c.is_topping"
+            )
+        }
+
+    @contextmanager
+    def transaction(self, conn):
+        """`with conn:` that also forgets the ids added inside it if it rolls back."""
+        self._added = []
+        try:
+            with conn:
+                yield
+        except BaseException:
+            for names, key in self._added:
+                added_id = names.pop(key)
+                if names is self.drinks:
+                    self.drink_names.pop(added_id, None)
+                    self.cup_drinks.discard(added_id)
+            raise
+        finally:
+            self._added = []
+
+    def _add(self, names, key, added_id):
+        names[key] = added_id
+        self._added.append((names, key))
+
+    def _name_id(self, conn, table, names, name):
+        if name not in names:
+            conn.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+            self._add(names, name, conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0])
+        return names[name]
+
+    def drink_id(self, conn, category, drink):
+        """Id of a drink, adding it (and its category) if it is not known yet."""
+        key = (category, drink)
+        if key not in self.drinks:
+            if category not in self.categories:
+                conn.execute(
+                    "INSERT OR IGNORE INTO categories (name, is_topping) VALUES (?, ?)",
+                    (category, int(category == TOPPINGS_CATEGORY)),
+                )
+                self._add(self.categories, category, conn.execute(
+                    "SELECT id FROM categories WHERE name = ?", (category,)
+                ).fetchone()[0])
+            conn.execute(
+                "INSERT OR IGNORE INTO drinks (category_id, name) VALUES (?, ?)",
+                (self.categories[category], drink),
+            )
+            drink_id = conn.execute(
+                "SELECT id FROM drinks WHERE category_id = ? AND name = ?", (self.categories[category], drink)
+            ).fetchone()[0]
+            if category != TOPPINGS_CATEGORY:
+                self.cup_drinks.add(drink_id)
+            self.drink_names[drink_id] = drink
+            self._add(self.drinks, key, drink_id)
+        return self.drinks[key]
+
+    def size_id(self, conn, size):
+        return self._name_id(conn, "sizes", self.sizes, size)
+
+    def payment_id(self, conn, payment_type):
+        return self._name_id(conn, "payment_types", self.payment_types, payment_type)
+
+dimensions = Dimensions()
+
+# ---------- range index ----------
+class FenwickTree:
+    """Prefix sums over slots 0..size-1: O(log n) point updates and range sums."""
+    __slots__ = ("tree",)
+
+    def __init__(self, values=()):
+        # Linear-time build: push each node's sum up to its parent once
+        tree = [0] + list(values)
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, slot: int, delta: int):
+        tree = self.tree
+        i = slot + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, end: int) -> int:
+        """Sum of slots [0, end)."""
+        tree = self.tree
+        total = 0
+        i = min(end, len(tree) - 1)
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def range_sum(self, start: int, end: int) -> int:
+        """Sum of slots [start, end)."""
+        return self.prefix(end) - self.prefix(start)
+
+    def values(self):
+        return [self.range_sum(slot, slot + 1) for slot in range(len(self))]
+
+class RangeIndex:
+    """Fenwick trees over the daily rollup, so any date range sums in O(log days).
+
+    Slots are day numbers counted from `base`. There is one pair of trees
+    (cups, satang) for the whole shop and one triple per drink for the
+    details breakdown; the third counts rollup days, so a drink sold only
+    for 0 THB still shows up. Built from daily_sales_summary at startup and
+    updated by record_sales() after each commit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(0, 0)
+
+    def _reset(self, base: int, size: int):
+        self.base = base
+        self.size = size
+        self.cups = FenwickTree([0] * size)
+        self.revenue = FenwickTree([0] * size)
+        self.drinks = {}  # drink id -> (cups, revenue, rollup days)
+        self.first_day = None
+        self.last_day = None
+
+    def load(self, conn):
+        rows = conn.execute('''
+            SELECT day, drink_id, SUM(cups), SUM(revenue)
+            FROM daily_sales_summary
+            GROUP BY day, drink_id
+        ''').fetchall()
+        with self._lock:
+            if rows:
+                first = min(row[0] for row in rows)
+                last = max(row[0] for row in rows)
+            else:
+                first = last = date_to_day(datetime.now().strftime("%Y-%m-%d"))
+            self._reset(first, max(64, (last - first + 1) * 2))
+            self._add_rows(rows)
+
+    def add_facts(self, facts):
+        """Count committed sale facts (ts, drink_id, size_id, payment_id, amount)."""
+        rows = [(ts // 86400, drink_id, int(drink_id in dimensions.cup_drinks), amount)
+                for ts, drink_id, _, _, amount in facts]
+        with self._lock:
+            self._add_rows(rows)
+
+    def _add_rows(self, rows):
+        for day, drink_id, cups, revenue in rows:
+            if not self.base <= day < self.base + self.size:
+                self._grow(day)
+            slot = day - self.base
+            self.cups.add(slot, cups)
+            self.revenue.add(slot, revenue)
+            trees = self.drinks.get(drink_id)
+            if trees is None:
+                trees = self.drinks[drink_id] = tuple(FenwickTree([0] * self.size) for _ in range(3))
+            drink_cups, drink_revenue, drink_days = trees
+            drink_cups.add(slot, cups)
+            drink_revenue.add(slot, revenue)
+            if not drink_days.range_sum(slot, slot + 1):
+                drink_days.add(slot, 1)
+            self.first_day = day if self.first_day is None else min(self.first_day, day)
+            self.last_day = day if self.last_day is None else max(self.last_day, day)
+
+    def _grow(self, day: int):
+        """Re-slot every tree so `day` fits, leaving as much room again on that side (rare)."""
+        low = min(self.base, day)
+        span = max(self.base + self.size, day + 1) - low
+        base = low - span if day < self.base else low
+        size = span * 2
+        shift = self.base - base
+
+        def moved(tree):
+            values = [0] * size
+            values[shift:shift + len(tree)] = tree.values()
+            return FenwickTree(values)
+
+        self.cups = moved(self.cups)
+        self.revenue = moved(self.revenue)
+        self.drinks = {drink_id: tuple(moved(tree) for tree in trees) for drink_id, trees in self.drinks.items()}
+        self.base = base
+        self.size = size
+
+    def span(self):
+        """(first, last) day with sales, or (None, None)."""
+        with self._lock:
+            return self.first_day, self.last_day
+
+    def _slots(self, start_day: int, end_day: int):
+        return start_day - self.base, end_day - self.base + 1
+
+    def totals(self, start_day: int, end_day: int):
+        """(cups, satang) for days start_day..end_day inclusive."""
+        with self._lock:
+            start, end = self._slots(start_day, end_day)
+            start, end = max(start, 0), max(end, 0)
+            return self.cups.range_sum(start, end), self.revenue.range_sum(start, end)
+
+    def details(self, start_day: int, end_day: int):
+        """[(drink_id, cups, satang)] for drinks sold in start_day..end_day."""
+        with self._lock:
+            start, end = self._slots(start_day, end_day)
+            start, end = max(start, 0), max(end, 0)
+            return [
+                (drink_id, cups.range_sum(start, end), revenue.range_sum(start, end))
+                for drink_id, (cups, revenue, days) in self.drinks.items()
+                if days.range_sum(start, end)
+            ]
+
+range_index = RangeIndex()
+
 def init_database():
     """Initialize SQLite database and create sales table if not exists."""
-    conn = sqlite3.connect('/data/sales.db')
+    db_pool.configure(DB_PATH)
+    conn = db_pool.connection()
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS sales (
@@ -150,192 +1118,1450 @@ def init_database():
         )
     ''')
     conn.commit()
-    conn.close()
+    migrate_database(conn)
+    with conn:
+        sync_dimensions(conn)
+    dimensions.load(conn)
+    range_index.load(conn)
+    sales_columns.load(conn)
+    quick_sales.load(conn)
     print("✅ Database initialized")
 
-def save_sale(drink_name, category, size, price, payment_type):
-    """Save a sale record to the database."""
-    conn = sqlite3.connect('/data/sales.db')
-    cursor = conn.cursor()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute('''
-        INSERT INTO sales (datetime, drink_name, category, size, price, payment_type)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (now, drink_name, category, size, price, payment_type))
-    conn.commit()
-    conn.close()
+def make_sale_row(drink_name, category, size, price, payment_type, moment=None, sale_key=None,
+                  order_key=None, order_item=None):
+    """Build a sale row tuple stamped with the time of the sale.
 
-def get_today_report():
-    """Get today's sales report with date (exclude toppings from cup count)."""
-    conn = sqlite3.connect('/data/sales.db')
-    cursor = conn.cursor()
-    today = datetime.now().strftime("%Y-%m-%d")
+    Rows keep the readable names so the write-behind journal stays valid
+    across schema changes; record_sales() maps them to dimension ids.
+    A row with a `sale_key` is stored at most once. Rows sharing an
+    `order_key` become the lines of one order.
+    """
+    moment = moment or datetime.now()
+    return (moment.strftime("%Y-%m-%d %H:%M:%S"), to_ts(moment),
+            drink_name, category, size, price, payment_type, sale_key, order_key, order_item)
 
-    cursor.execute('''
-        SELECT 
-            SUM(CASE WHEN category != 'ท็อปปิ้ง / Toppings' THEN 1 ELSE 0 END) AS cups,
-            SUM(price) AS total_price
-        FROM sales
-        WHERE datetime LIKE ?
-    ''', (f"{today}%",))
+def make_order_rows(lines, payment_type, order_key, moment=None):
+    """Sale rows for one order.
 
-    result = cursor.fetchone()
-    conn.close()
-    
-    cups = result[0] if result[0] else 0
-    total = result[1] if result[1] else 0
-    
+    `lines` are (order_item, drink_name, category, size, price); a drink's
+    toppings share its order_item. Line n gets the sale key
+    "<order_key>:<n>", so the whole order is stored at most once.
+    """
+    moment = moment or datetime.now()
+    return [make_sale_row(drink_name, category, size, price, payment_type, moment,
+                          sale_key=f"{order_key}:{n}", order_key=order_key, order_item=order_item)
+            for n, (order_item, drink_name, category, size, price) in enumerate(lines, start=1)]
+
+def _order_id(conn, order_key, ts, payment_id):
+    """Id of the order header for `order_key`, creating an empty one if needed."""
+    conn.execute(
+        "INSERT OR IGNORE INTO orders (order_key, ts, payment_id, amount, lines) VALUES (?, ?, ?, 0, 0)",
+        (order_key, ts, payment_id),
+    )
+    return conn.execute("SELECT id FROM orders WHERE order_key = ?", (order_key,)).fetchone()[0]
+
+def record_sales(rows, journal_seq=None):
+    """Insert sale rows and update the daily rollup in one transaction.
+
+    `journal_seq` is the highest write-behind journal entry in `rows`; it is
+    committed together with them so a replay never inserts them twice.
+    Rows whose `sale_key` is already stored are skipped; order headers get
+    the total and line count of the lines actually inserted. Returns the set
+    of days that got new sales.
+    """
+    conn = db_pool.connection()
+    with dimensions.transaction(conn):
+        facts = []
+        orders = {}  # order_key -> [order id, satang, lines]
+        for row in rows:
+            _, ts, drink_name, category, size, price, payment_type = row[:7]
+            # Rows journaled by older versions lack the sale key and order fields
+            sale_key, order_key, order_item = (tuple(row[7:]) + (None, None, None))[:3]
+            fact = (ts, dimensions.drink_id(conn, category, drink_name), dimensions.size_id(conn, size),
+                    dimensions.payment_id(conn, payment_type), to_satang(price))
+            order = None
+            if order_key is not None:
+                order = orders.get(order_key)
+                if order is None:
+                    order = orders[order_key] = [_order_id(conn, order_key, ts, fact[3]), 0, 0]
+            inserted = conn.execute('''
+                INSERT OR IGNORE INTO sales (ts, drink_id, size_id, payment_id, amount, sale_key, order_id, order_item)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (*fact, sale_key, order and order[0], order_item)).rowcount
+            if inserted:
+                facts.append(fact)
+                if order is not None:
+                    order[1] += fact[4]
+                    order[2] += 1
+        conn.executemany(
+            "UPDATE orders SET amount = amount + ?, lines = lines + ? WHERE id = ?",
+            [(amount, lines, order_id) for order_id, amount, lines in orders.values() if lines],
+        )
+        conn.executemany('''
+            INSERT INTO daily_sales_summary (day, drink_id, payment_id, cups, revenue)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (day, drink_id, payment_id) DO UPDATE SET
+                cups = cups + excluded.cups,
+                revenue = revenue + excluded.revenue
+        ''', [(ts // 86400, drink_id, payment_id, int(drink_id in dimensions.cup_drinks), amount)
+              for ts, drink_id, _, payment_id, amount in facts])
+        if journal_seq is not None:
+            set_meta(conn, 'sale_journal_seq', journal_seq)
+    range_index.add_facts(facts)
+    sales_columns.append_facts(facts)
+    quick_sales.add_facts(facts)
+    return {day_to_date(ts // 86400) for ts, *_ in facts}
+
+def save_sale(drink_name, category, size, price, payment_type, sale_key=None):
+    """Save a sale record and update the daily rollup in one transaction.
+
+    Returns the sale's day (YYYY-MM-DD).
+    """
+    row = make_sale_row(drink_name, category, size, price, payment_type, sale_key=sale_key)
+    record_sales([row])
+    return row[0][:10]
+
+def get_meta(key, default=None):
+    """Read a value from the `meta` key/value table."""
+    row = db_pool.connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(conn, key, value):
+    """Write a value to the `meta` table (caller owns the transaction)."""
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+def write_session(user_id, values):
+    """Upsert a persisted session, or delete it when `values` is None."""
+    conn = db_pool.connection()
+    with conn:
+        if values is None:
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, category, drink, items, touched, sale_key) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, *values),
+            )
+
+def load_sessions(ttl: float):
+    """Drop expired persisted sessions and return the rest, least recently used first."""
+    conn = db_pool.connection()
+    with conn:
+        conn.execute("DELETE FROM sessions WHERE touched < ?", (time.time() - ttl,))
+    return [
+        (user_id, category, drink, json.loads(items), touched, sale_key)
+        for user_id, category, drink, items, touched, sale_key in conn.execute(
+            "SELECT user_id, category, drink, items, touched, sale_key FROM sessions ORDER BY touched"
+        )
+    ]
+
+def report_period(kind: str):
+    """Return the (start_date, end_date) a fixed report covers; (None, None) for all-time."""
+    today = datetime.now()
+    if kind == "today":
+        day = today.strftime("%Y-%m-%d")
+        return day, day
+    if kind == "week":
+        monday = today - timedelta(days=today.weekday())
+        sunday = monday + timedelta(days=6)
+        return monday.strftime("%Y-%m-%d"), sunday.strftime("%Y-%m-%d")
+    if kind == "month":
+        return today.replace(day=1).strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
+    return None, None
+
+def _range_totals(start_date: str, end_date: str):
+    """(cups, total baht) for whole days start_date..end_date, from the range index."""
+    cups, revenue = range_index.totals(date_to_day(start_date), date_to_day(end_date))
+    return cups, (revenue / 100 if revenue else 0)
+
+def get_range_report(start_date: str, end_date: str):
+    """Sales report for any whole days start_date..end_date (exclude toppings from cup count)."""
+    cups, total = _range_totals(start_date, end_date)
+    return start_date, end_date, cups, total
+
+def get_today_report():
+    """Get today's sales report with date (exclude toppings from cup count)."""
+    today, _ = report_period("today")
+    cups, total = _range_totals(today, today)
     return today, cups, total
 
 def get_week_report():
     """Get current week's sales report (Monday to Sunday, exclude toppings from cup count)."""
-    from datetime import timedelta
-    conn = sqlite3.connect('/data/sales.db')
-    cursor = conn.cursor()
-    
-    today = datetime.now()
-    monday = today - timedelta(days=today.weekday())
-    sunday = monday + timedelta(days=6)
-    
-    start_date = monday.strftime("%Y-%m-%d")
-    end_date = sunday.strftime("%Y-%m-%d")
-    
-    cursor.execute('''
-        SELECT 
-            SUM(CASE WHEN category != 'ท็อปปิ้ง / Toppings' THEN 1 ELSE 0 END) AS cups,
-            SUM(price) AS total_price
-        FROM sales
-        WHERE datetime >= ? AND datetime <= ?
-    ''', (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
-    cups = result[0] if result[0] else 0
-    total = result[1] if result[1] else 0
+    start_date, end_date = report_period("week")
+    cups, total = _range_totals(start_date, end_date)
     return start_date, end_date, cups, total
 
 def get_month_report():
     """Get current month's sales report (exclude toppings from cup count)."""
-    conn = sqlite3.connect('/data/sales.db')
-    cursor = conn.cursor()
-    
-    today = datetime.now()
-    start_date = today.replace(day=1).strftime("%Y-%m-%d")
-    end_date = today.strftime("%Y-%m-%d")
-    
-    cursor.execute('''
-        SELECT 
-            SUM(CASE WHEN category != 'ท็อปปิ้ง / Toppings' THEN 1 ELSE 0 END) AS cups,
-            SUM(price) AS total_price
-        FROM sales
-        WHERE datetime >= ? AND datetime <= ?
-    ''', (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
-    cups = result[0] if result[0] else 0
-    total = result[1] if result[1] else 0
+    start_date, end_date = report_period("month")
+    cups, total = _range_totals(start_date, end_date)
     return start_date, end_date, cups, total
 
 def get_alltime_report():
     """Get all-time sales report (exclude toppings from cup count)."""
-    conn = sqlite3.connect('/data/sales.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT 
-            SUM(CASE WHEN category != 'ท็อปปิ้ง / Toppings' THEN 1 ELSE 0 END) AS cups,
-            SUM(price) AS total_price,
-            MIN(datetime),
-            MAX(datetime)
-        FROM sales
-    ''')
-    
-    result = cursor.fetchone()
-    conn.close()
-    
-    cups = result[0] if result[0] else 0
-    total = result[1] if result[1] else 0
-    
-    if result[2] and result[3]:
-        start_date = result[2][:10]
-        end_date   = result[3][:10]
-    else:
-        start_date = "N/A"
-        end_date   = "N/A"
-    
+    first_day, last_day = range_index.span()
+    if first_day is None:
+        return "N/A", "N/A", 0, 0
+    start_date, end_date = day_to_date(first_day), day_to_date(last_day)
+    cups, total = _range_totals(start_date, end_date)
     return start_date, end_date, cups, total
 
-def get_sales_details(start_datetime: str, end_datetime: str):
-    """Get sales breakdown by drink for a given date range.
+def get_sales_details(start_date: str, end_date: str):
+    """Get sales breakdown by drink for whole days start_date..end_date.
     Cups = only non-toppings, revenue = all.
     """
-    conn = sqlite3.connect('/data/sales.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT 
-            drink_name,
-            SUM(CASE WHEN category != 'ท็อปปิ้ง / Toppings' THEN 1 ELSE 0 END) AS cups,
-            SUM(price) AS total_price
-        FROM sales
-        WHERE datetime >= ? AND datetime <= ?
-        GROUP BY drink_name
-        ORDER BY total_price DESC
-    ''', (start_datetime, end_datetime))
-    
-    results = cursor.fetchall()
-    conn.close()
-    
-    return results
+    by_name = {}
+    for drink_id, cups, revenue in range_index.details(date_to_day(start_date), date_to_day(end_date)):
+        name = dimensions.drink_names[drink_id]
+        total_cups, total_revenue = by_name.get(name, (0, 0))
+        by_name[name] = (total_cups + cups, total_revenue + revenue)
+    rows = sorted(((name, cups, revenue) for name, (cups, revenue) in by_name.items()),
+                  key=lambda row: (row[2], row[0]), reverse=True)
+    return [(drink_name, cups, revenue / 100) for drink_name, cups, revenue in rows]
 
-# ============================================================================
-# USER SESSION STORAGE
-# ============================================================================
-# Simple in-memory storage for user sale sessions
-user_sessions = {}
+# ---------- export ----------
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_GZIP_LEVEL = 6  # level 9 is ~2x slower for a few percent smaller files
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_COLUMNS = ("id", "datetime", "drink_name", "category", "size", "price", "payment_type")
 
-def get_session(user_id):
-    """Get or create a session for a user."""
-    if user_id not in user_sessions:
-        user_sessions[user_id] = {}
-    return user_sessions[user_id]
+def export_sales(path: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                 fmt: str = "csv") -> int:
+    """Write sales for whole days start_date..end_date (all when None) to `path`.
 
-def clear_session(user_id):
-    """Clear a user's session."""
-    if user_id in user_sessions:
-        user_sessions[user_id] = {}
+    Rows are fetched EXPORT_CHUNK_ROWS at a time and written straight out,
+    gzip-compressed when `path` ends in .gz, so memory use does not grow
+    with the size of the history. Returns the number of rows written.
+    """
+    select = '''
+        SELECT s.id, strftime('%Y-%m-%d %H:%M:%S', s.ts, 'unixepoch'),
+               d.name, c.name, z.name, s.amount / 100.0, p.name
+        FROM {source} s
+        JOIN drinks d ON d.id = s.drink_id
+        JOIN categories c ON c.id = d.category_id
+        JOIN sizes z ON z.id = s.size_id
+        JOIN payment_types p ON p.id = s.payment_id
+        WHERE s.ts >= ? AND s.ts < ?
+        ORDER BY s.ts, s.id
+    '''
+    # Archived months come from their archive file (plus any late sales not
+    # moved yet), attached read-only for just that month's rows.
+    live = select.format(source="main.sales")
+    archived = select.format(source=f"(SELECT {SALE_FIELDS} FROM archive.sales "
+                                    f"UNION ALL SELECT {SALE_FIELDS} FROM main.sales)")
+    if start_date is None:
+        start_ts, end_ts = 0, 2 ** 62
+    else:
+        start_ts, end_ts = date_to_day(start_date) * 86400, (date_to_day(end_date) + 1) * 86400
+    conn = db_pool.connection()
 
-# ============================================================================
-# KEYBOARD BUILDERS
-# ============================================================================
-def get_main_keyboard(is_admin: bool):
-    """Create the main menu keyboard."""
-    rows = [
-        [InlineKeyboardButton(text="🆕 ขายใหม่ / New sale", callback_data="new_sale")],
-        [InlineKeyboardButton(text="📊 รายงานวันนี้ / Today report", callback_data="today_report")]
-    ]
-    if is_admin:
-        rows.append([InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")])
-    return InlineKeyboardMarkup(inline_keyboard=rows)
+    if path.endswith(".gz"):
+        out = gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=EXPORT_GZIP_LEVEL)
+    else:
+        out = open(path, "w", encoding="utf-8", newline="")
+    written = 0
+    with out:
+        writer = csv.writer(out) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(EXPORT_COLUMNS)
+        for segment_start, segment_end, month in _sales_segments(conn, start_ts, end_ts):
+            if month is not None:
+                _attach_archive(conn, month)
+            try:
+                cursor = conn.execute(live if month is None else archived, (segment_start, segment_end))
+                while True:
+                    rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+                    if not rows:
+                        break
+                    if writer is not None:
+                        writer.writerows(rows)
+                    else:
+                        out.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n"
+                                       for row in rows)
+                    written += len(rows)
+                cursor.close()
+            finally:
+                if month is not None:
+                    conn.execute("DETACH DATABASE archive")
+    return written
 
-def get_admin_keyboard():
-    """Create the admin menu keyboard."""
+# ---------- import ----------
+# Bulk load of historical sales from another POS (`python main.py import`).
+# Rows go in with executemany in large batches inside one transaction, with
+# the time index dropped while loading and the imported rows added to the
+# daily rollup once at the end, instead of one commit and one rollup upsert
+# per sale. Because that transaction would hold the bot's writes up past their
+# busy timeout and leave its in-memory indexes stale, the import takes an
+# exclusive lock up front and refuses to run while the bot has the file open.
+IMPORT_BATCH_ROWS = 10000
+IMPORT_REQUIRED_COLUMNS = ("datetime", "drink_name", "size", "price")
+
+def _menu_key(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+@lru_cache(maxsize=1)
+def _menu_lookup():
+    """Drink name -> [(category, drink)], by full name and by its Thai or English half."""
+    lookup = {}
+    for category, drinks in MENU.items():
+        for drink in drinks:
+            keys = {_menu_key(drink), *(_menu_key(half) for half in drink.split(" / "))}
+            for key in keys:
+                lookup.setdefault(key, []).append((category, drink))
+    return lookup
+
+def _match_category(name: str, category: str) -> bool:
+    key = _menu_key(name)
+    return key == _menu_key(category) or key in (_menu_key(half) for half in category.split(" / "))
+
+def resolve_menu_item(drink_name: str, category_name: str = "", size: str = ""):
+    """Map POS names to (category, drink, size, menu price), or raise ValueError with the reason."""
+    matches = _menu_lookup().get(_menu_key(drink_name), [])
+    if category_name:
+        matches = [match for match in matches if _match_category(category_name, match[0])]
+    if not matches:
+        raise ValueError("unknown drink")
+    if len(matches) > 1:
+        raise ValueError("ambiguous drink")
+    category, drink = matches[0]
+    sizes = MENU[category][drink]
+    if not size and len(sizes) == 1:
+        size = next(iter(sizes))
+    for menu_size, price in sizes.items():
+        if menu_size.casefold() == size.strip().casefold():
+            return category, drink, menu_size, price
+    raise ValueError("unknown size")
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _add_to_daily_summary(conn, after_id: int):
+    """Add the sales with id > after_id to the daily rollup in one grouped statement.
+
+    Adding rather than recomputing the days keeps the totals of sales that
+    were already moved to an archive.
+    """
+    conn.execute('''
+        INSERT INTO daily_sales_summary (day, drink_id, payment_id, cups, revenue)
+        SELECT s.ts / 86400, s.drink_id, s.payment_id, SUM(NOT c.is_topping), SUM(s.amount)
+        FROM sales s
+        JOIN drinks d ON d.id = s.drink_id
+        JOIN categories c ON c.id = d.category_id
+        WHERE s.id > ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, drink_id, payment_id) DO UPDATE SET
+            cups = cups + excluded.cups,
+            revenue = revenue + excluded.revenue
+    ''', (after_id,))
+
+@contextmanager
+def _exclusive_access(conn):
+    """Hold the database alone for the duration, failing at once if anything else has it open.
+
+    In WAL mode every open connection, even an idle one such as a running
+    bot's, keeps a shared lock on the -shm file, so taking the exclusive
+    lock fails immediately instead of stalling the bot's sale writes.
+    """
+    conn.execute("PRAGMA busy_timeout = 0")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+    try:
+        try:
+            conn.execute("BEGIN EXCLUSIVE")
+            conn.commit()  # the lock stays held in exclusive locking mode
+        except sqlite3.OperationalError:
+            raise ValueError(f"{DB_PATH} is in use (is the bot running?); stop it before importing") from None
+        yield
+    finally:
+        conn.execute("PRAGMA locking_mode = NORMAL")
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()  # releases the lock
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+
+def import_sales(path: str, default_payment: str = "cash", check_prices: bool = True,
+                 rejects_path: Optional[str] = None, force: bool = False):
+    """Load sales from a POS CSV (gzipped when `path` ends in .gz).
+
+    The header must name at least the IMPORT_REQUIRED_COLUMNS; `category`
+    and `payment_type` are optional and other columns are ignored, so a
+    file written by export_sales() loads as is. Drinks may be given by the
+    full menu name or just its Thai or English half. With `check_prices`
+    a row whose price differs from the menu is rejected.
+
+    Everything is committed in one transaction, so a failed import leaves
+    the database untouched, and a file is only imported once unless `force`.
+    Refuses to run while another connection (e.g. the bot) has the database
+    open. Returns (imported, Counter of reject reasons).
+    """
+    digest = _file_digest(path)
+    conn = db_pool.connection()
+    if not force and get_meta(f"import:{digest}") is not None:
+        raise ValueError(f"{path} was already imported (use --force to load it again)")
+
+    opener = gzip.open if path.endswith(".gz") else open
+    rejects = Counter()
+    imported = 0
+    reject_file = reject_writer = None
+    resolved = {}  # (drink, category, size) -> (drink_id, size_id, menu satang) or the reject reason
+
+    def reject(line, row, reason):
+        rejects[reason] += 1
+        if reject_writer is not None:
+            reject_writer.writerow([line, reason, *row.values()])
+
+    try:
+        with _exclusive_access(conn), opener(path, "rt", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            columns = [(name or "").strip().lower() for name in reader.fieldnames or ()]
+            missing = [name for name in IMPORT_REQUIRED_COLUMNS if name not in columns]
+            if missing:
+                raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+            reader.fieldnames = columns
+            if rejects_path:
+                reject_file = open(rejects_path, "w", encoding="utf-8", newline="")
+                reject_writer = csv.writer(reject_file)
+                reject_writer.writerow(["line", "reason", *columns])
+
+            conn.execute("BEGIN")
+            with conn:
+                # Ids only grow (AUTOINCREMENT), so everything above this is new
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+                conn.execute("DROP INDEX IF EXISTS idx_sales_ts")
+                batch = []
+                for line, row in enumerate(reader, start=2):
+                    key = (row["drink_name"] or "", row.get("category") or "", row["size"] or "")
+                    item = resolved.get(key)
+                    if item is None:
+                        try:
+                            category, drink, size, price = resolve_menu_item(*key)
+                            item = (dimensions.drinks[(category, drink)], dimensions.sizes[size], to_satang(price))
+                        except ValueError as e:
+                            item = str(e)
+                        resolved[key] = item
+                    if isinstance(item, str):
+                        reject(line, row, item)
+                        continue
+                    drink_id, size_id, menu_amount = item
+                    try:
+                        ts = to_ts(datetime.fromisoformat((row["datetime"] or "").strip()))
+                    except ValueError:
+                        reject(line, row, "bad datetime")
+                        continue
+                    try:
+                        amount = to_satang(float(row["price"]))
+                    except (TypeError, ValueError, OverflowError):
+                        reject(line, row, "bad price")
+                        continue
+                    if amount < 0:
+                        reject(line, row, "bad price")
+                        continue
+                    if check_prices and amount != menu_amount:
+                        reject(line, row, "price not on menu")
+                        continue
+                    payment_type = (row.get("payment_type") or default_payment).strip().lower()
+                    payment_id = dimensions.payment_types.get(payment_type)
+                    if payment_id is None:
+                        reject(line, row, "unknown payment type")
+                        continue
+                    batch.append((ts, drink_id, size_id, payment_id, amount))
+                    if len(batch) == IMPORT_BATCH_ROWS:
+                        conn.executemany(
+                            "INSERT INTO sales (ts, drink_id, size_id, payment_id, amount) VALUES (?, ?, ?, ?, ?)",
+                            batch)
+                        imported += len(batch)
+                        batch = []
+                conn.executemany(
+                    "INSERT INTO sales (ts, drink_id, size_id, payment_id, amount) VALUES (?, ?, ?, ?, ?)", batch)
+                imported += len(batch)
+                conn.execute("CREATE INDEX idx_sales_ts ON sales (ts)")
+                if imported:
+                    _add_to_daily_summary(conn, last_id)
+                set_meta(conn, f"import:{digest}", imported)
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+
+    if imported:
+        range_index.load(conn)
+        sales_columns.load(conn)
+        quick_sales.load(conn)
+        report_cache.clear()
+    return imported, rejects
+
+# ---------- archive ----------
+# Closed months move out of the live database into one file per month
+# (<archive dir>/sales_YYYY-MM.db), listed in the `partitions` catalog. The
+# daily rollup keeps every month, so reports (all of which read it through
+# the range index) never open an archive; only raw-row exports attach them,
+# read-only, one month at a time.
+ARCHIVE_KEEP_MONTHS = int(os.getenv('ARCHIVE_KEEP_MONTHS', '2'))  # live months incl. the current one; 0 = off
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')  # default: "archive" next to the database
+ARCHIVE_CHECK_HOURS = 6
+ARCHIVE_VACUUM_FREE_RATIO = 0.25  # `archive` CLI: compact the live file once this share of it is free pages
+
+SALE_FIELDS = "id, ts, drink_id, size_id, payment_id, amount, sale_key, order_id, order_item"
+ORDER_FIELDS = "id, order_key, ts, payment_id, amount, lines"
+
+def archive_dir() -> str:
+    return ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "archive")
+
+def month_bounds(month: str):
+    """(start_ts, end_ts) of a YYYY-MM month."""
+    year, number = map(int, month.split("-"))
+    return to_ts(datetime(year, number, 1)), to_ts(datetime(year + number // 12, number % 12 + 1, 1))
+
+def _attach_archive(conn, month: str, read_only: bool = True):
+    path = os.path.join(archive_dir(), f"sales_{month}.db")
+    conn.execute("ATTACH DATABASE ? AS archive",
+                 (f"file:{urllib.parse.quote(path)}?mode={'ro' if read_only else 'rwc'}",))
+
+def archive_month(conn, month: str) -> int:
+    """Move one month's sales and orders to its archive file. Returns the sales moved.
+
+    Two transactions, each atomic on its own: rows are first copied into the
+    archive (ids are never reused, so copying again after a crash changes
+    nothing), then deleted from the live database where the archive holds them.
+    """
+    start, end = month_bounds(month)
+    os.makedirs(archive_dir(), exist_ok=True)
+    _attach_archive(conn, month, read_only=False)
+    try:
+        conn.execute("PRAGMA archive.journal_mode = DELETE")  # no -wal/-shm files next to an archive
+        conn.execute("BEGIN")
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS archive.orders (
+                    id INTEGER PRIMARY KEY,
+                    order_key TEXT NOT NULL UNIQUE,
+                    ts INTEGER NOT NULL,
+                    payment_id INTEGER NOT NULL,
+                    amount INTEGER NOT NULL,
+                    lines INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS archive.sales (
+                    id INTEGER PRIMARY KEY,
+                    ts INTEGER NOT NULL,
+                    drink_id INTEGER NOT NULL,
+                    size_id INTEGER NOT NULL,
+                    payment_id INTEGER NOT NULL,
+                    amount INTEGER NOT NULL,
+                    sale_key TEXT,
+                    order_id INTEGER,
+                    order_item INTEGER
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_sales_ts ON sales (ts)")
+            conn.execute(f"INSERT OR IGNORE INTO archive.orders SELECT {ORDER_FIELDS} FROM main.orders "
+                         "WHERE ts >= ? AND ts < ?", (start, end))
+            conn.execute(f"INSERT OR IGNORE INTO archive.sales SELECT {SALE_FIELDS} FROM main.sales "
+                         "WHERE ts >= ? AND ts < ?", (start, end))
+        conn.execute("BEGIN")
+        with conn:
+            moved = conn.execute(
+                "DELETE FROM main.sales WHERE ts >= ? AND ts < ? AND id IN (SELECT id FROM archive.sales)",
+                (start, end),
+            ).rowcount
+            conn.execute(
+                "DELETE FROM main.orders WHERE ts >= ? AND ts < ? AND id IN (SELECT id FROM archive.orders)",
+                (start, end),
+            )
+            sales, amount, first_ts, last_ts = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(amount), 0), MIN(ts), MAX(ts) FROM archive.sales"
+            ).fetchone()
+            conn.execute('''
+                INSERT OR REPLACE INTO partitions (month, file, first_ts, last_ts, sales, amount, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (month, f"sales_{month}.db", first_ts, last_ts, sales, amount, int(time.time())))
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    return moved
+
+def archive_oldest_month(keep_months: int = ARCHIVE_KEEP_MONTHS):
+    """Archive the oldest month before the last `keep_months` (the current month counts).
+
+    Months that trend reports or quick sales still read are kept regardless.
+    Returns (month, sales moved), or None when nothing is left to archive.
+    Sales that arrive late for an archived month are appended to its
+    archive on the next run.
+    """
+    if keep_months <= 0:
+        return None
+    today = datetime.now()
+    first_kept = today.year * 12 + today.month - keep_months  # months since year 0, 0-based
+    # Trend reports and quick sales load recent raw sales at startup, so the
+    # months they look back over always stay live
+    horizon = today - timedelta(days=max(ANALYTICS_DAYS, QUICK_SALE_HALF_LIFE_DAYS * QUICK_SALE_HISTORY_HALF_LIVES))
+    first_kept = min(first_kept, horizon.year * 12 + horizon.month - 1)
+    cutoff = to_ts(datetime(first_kept // 12, first_kept % 12 + 1, 1))
+    conn = db_pool.connection()
+    oldest = conn.execute("SELECT MIN(ts) FROM sales WHERE ts < ?", (cutoff,)).fetchone()[0]
+    if oldest is None:
+        return None
+    month = day_to_date(oldest // 86400)[:7]
+    moved = archive_month(conn, month)
+    print(f"🗄 Archived {moved} sales from {month}")
+    return month, moved
+
+def archive_closed_months(keep_months: int = ARCHIVE_KEEP_MONTHS):
+    """Archive every closed month archive_oldest_month() would. Returns [(month, sales moved)]."""
+    archived = []
+    while True:
+        result = archive_oldest_month(keep_months)
+        if result is None:
+            break
+        archived.append(result)
+        if not result[1]:
+            break  # nothing could be moved; do not spin
+    return archived
+
+def compact_database(min_free_ratio: float = ARCHIVE_VACUUM_FREE_RATIO) -> bool:
+    """VACUUM the live file once archiving has left enough of it free.
+
+    VACUUM rewrites the whole file under an exclusive lock, so only the CLI
+    runs it; under the bot, freed pages are simply reused by new sales.
+    """
+    conn = db_pool.connection()
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    if not pages or free / pages < min_free_ratio:
+        return False
+    conn.execute("VACUUM")
+    print(f"🧹 Compacted the live database ({free} of {pages} pages were free)")
+    return True
+
+def list_partitions():
+    """Catalog rows (month, file, first_ts, last_ts, sales, satang), oldest first."""
+    return db_pool.connection().execute(
+        "SELECT month, file, first_ts, last_ts, sales, amount FROM partitions ORDER BY month"
+    ).fetchall()
+
+def _sales_segments(conn, start_ts: int, end_ts: int):
+    """Split [start_ts, end_ts) into (start, end, archived month or None) pieces, in time order."""
+    segments = []
+    position = start_ts
+    for (month,) in conn.execute("SELECT month FROM partitions ORDER BY month"):
+        month_start, month_end = month_bounds(month)
+        if month_end <= start_ts or month_start >= end_ts:
+            continue
+        month_start, month_end = max(month_start, start_ts), min(month_end, end_ts)
+        if position < month_start:
+            segments.append((position, month_start, None))
+        segments.append((month_start, month_end, month))
+        position = month_end
+    if position < end_ts:
+        segments.append((position, end_ts, None))
+    return segments
+
+# ---------- backup ----------
+# Snapshots of the live database taken with SQLite's online backup API from
+# a separate connection on the backup thread, BACKUP_STEP_PAGES pages per
+# step with a short pause in between, so the writer thread keeps storing
+# sales meanwhile. Each snapshot is integrity-checked, gzipped and rotated;
+# archive files are mirrored once per change instead of being rotated.
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))  # 0 = only on /backup
+BACKUP_DIR = os.getenv('BACKUP_DIR', '')  # default: "backups" next to the database
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+BACKUP_COMPRESS = os.getenv('BACKUP_COMPRESS', '1') == '1'
+BACKUP_STEP_PAGES = int(os.getenv('BACKUP_STEP_PAGES', '256'))
+BACKUP_STEP_SLEEP = 0.005  # pause after each step (backup()'s own sleep= only applies to BUSY/LOCKED retries)
+BACKUP_MAX_RESTARTS = 3  # a commit between steps restarts the copy; after this many, copy in one step
+BACKUP_RETRY_SECONDS = 600
+
+class _BackupRestarted(Exception):
+    pass
+
+def backup_dir() -> str:
+    return BACKUP_DIR or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "backups")
+
+def _copy_database(source_path: str, target_path: str) -> int:
+    """Copy a live database to target_path as one self-contained file. Returns its pages.
+
+    Stepwise first; if sales keep restarting the copy, it is done in a
+    single step instead, which in WAL mode reads one snapshot and still
+    does not block writers.
+    """
+    source = sqlite3.connect(source_path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    target = sqlite3.connect(target_path)
+    try:
+        remaining = [None]
+        restarts = [0]
+
+        def on_step(status, left, total):
+            if remaining[0] is not None and left >= remaining[0]:
+                restarts[0] += 1
+                if restarts[0] > BACKUP_MAX_RESTARTS:
+                    raise _BackupRestarted
+            remaining[0] = left
+            if left:
+                time.sleep(BACKUP_STEP_SLEEP)
+
+        try:
+            source.backup(target, pages=BACKUP_STEP_PAGES, progress=on_step)
+        except _BackupRestarted:
+            source.backup(target)
+        target.execute("PRAGMA journal_mode = DELETE")  # no -wal/-shm files next to a snapshot
+        check = target.execute("PRAGMA integrity_check").fetchone()[0]
+        if check != "ok":
+            raise sqlite3.DatabaseError(f"backup of {source_path} failed the integrity check: {check}")
+        return target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        source.close()
+        target.close()
+
+def _store_snapshot(source_path: str, target_path: str) -> int:
+    """Copy, check and (with BACKUP_COMPRESS) gzip a database to target_path[.gz].
+
+    Written under a temporary name and renamed at the end, so a crash never
+    leaves a half-written backup behind. Returns the uncompressed size.
+    """
+    temp_path = target_path + ".partial"
+    _copy_database(source_path, temp_path)
+    size = os.path.getsize(temp_path)
+    if BACKUP_COMPRESS:
+        with open(temp_path, "rb") as raw, gzip.open(temp_path + ".gz", "wb", compresslevel=6) as packed:
+            shutil.copyfileobj(raw, packed, 1024 * 1024)
+        os.remove(temp_path)
+        os.replace(temp_path + ".gz", target_path + ".gz")
+    else:
+        os.replace(temp_path, target_path)
+    return size
+
+def _mirror_archives(directory: str) -> int:
+    """Back up archive files that are new or changed since their last copy. Returns how many."""
+    source_dir = archive_dir()
+    if not os.path.isdir(source_dir):
+        return 0
+    mirror = os.path.join(directory, "archive")
+    os.makedirs(mirror, exist_ok=True)
+    copied = 0
+    for name in sorted(os.listdir(source_dir)):
+        if not (name.startswith("sales_") and name.endswith(".db")):
+            continue
+        source = os.path.join(source_dir, name)
+        target = os.path.join(mirror, name)
+        stored = target + ".gz" if BACKUP_COMPRESS else target
+        if os.path.exists(stored) and os.path.getmtime(stored) >= os.path.getmtime(source):
+            continue
+        _store_snapshot(source, target)
+        copied += 1
+    return copied
+
+def list_backups(directory: Optional[str] = None):
+    """Snapshot file paths in the backup directory, oldest first."""
+    directory = directory or backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith("sales_") and name.endswith((".db", ".db.gz")))
+
+def backup_database(keep: int = BACKUP_KEEP):
+    """Snapshot the live database and mirror the archives; keep the newest `keep` snapshots.
+
+    Returns (path, bytes on disk, database bytes, seconds, archive files copied).
+    """
+    started = time.perf_counter()
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, f"sales_{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+    size = _store_snapshot(DB_PATH, target)
+    path = target + ".gz" if BACKUP_COMPRESS else target
+    archives = _mirror_archives(directory)
+    for old in list_backups(directory)[:-keep] if keep > 0 else []:
+        os.remove(old)
+    elapsed = time.perf_counter() - started
+    print(f"💾 Backed up {size / 1e6:.1f} MB to {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {elapsed:.1f}s")
+    return path, os.path.getsize(path), size, elapsed, archives
+
+# ============================================================================
+# REPORT CACHE
+# ============================================================================
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '64'))
+
+class ReportCache:
+    """LRU cache of rendered reports (text + keyboard).
+
+    Keys are (report kind, start_date, end_date, is_admin); a range of
+    (None, None) means open-ended (all-time). A new sale only drops the
+    entries whose range contains the sale's day.
+    """
+
+    def __init__(self, max_entries: int = REPORT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.version = 0  # bumped on every invalidation
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, version: int):
+        """Store a value computed when the cache was at `version`.
+
+        A sale recorded while the report was being built makes it stale, so
+        it is dropped instead of cached.
+        """
+        if version != self.version:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached report (after a bulk import)."""
+        self.version += 1
+        self._entries.clear()
+
+    def invalidate_day(self, day: str):
+        """Drop every cached report whose date range contains `day`."""
+        self.version += 1
+        for key in list(self._entries):
+            _, start, end, _ = key
+            if start is None or start <= day <= end:
+                del self._entries[key]
+
+report_cache = ReportCache()
+
+# ============================================================================
+# COLUMNAR ANALYTICS
+# ============================================================================
+# Trend reports (sales by hour, by weekday) group every sale in a window.
+# Instead of GROUP BYs over `sales`, the whole history is kept in memory as
+# parallel typed arrays (20 bytes a sale), loaded once at startup and
+# appended to after each commit. Group-bys are vectorized with NumPy when it
+# is installed and fall back to a plain loop otherwise.
+ANALYTICS_DAYS = int(os.getenv('ANALYTICS_DAYS', '28'))
+WEEKDAY_NAMES = ("จ. / Mon", "อ. / Tue", "พ. / Wed", "พฤ. / Thu", "ศ. / Fri", "ส. / Sat", "อา. / Sun")
+
+# Group keys: name -> number of groups. 1970-01-01 was a Thursday (weekday 3).
+ANALYTICS_GROUPS = {"hour": 24, "weekday": 7, "weekday_hour": 7 * 24}
+
+class SalesColumns:
+    """Every sale as columns: time, drink id and amount in satang."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ts = array('q')
+        self.drink = array('i')
+        self.amount = array('q')
+        self.ordered = True  # ts never decreases, so a window can be found by bisection
+
+    def __len__(self):
+        return len(self.ts)
+
+    def load(self, conn):
+        ts, drink, amount = array('q'), array('i'), array('q')
+        cursor = conn.execute("SELECT ts, drink_id, amount FROM sales ORDER BY ts")
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            column_ts, column_drink, column_amount = zip(*rows)
+            ts.extend(column_ts)
+            drink.extend(column_drink)
+            amount.extend(column_amount)
+        with self._lock:
+            self.ts, self.drink, self.amount = ts, drink, amount
+            self.ordered = True
+
+    def append_facts(self, facts):
+        """Add committed sale facts (ts, drink_id, size_id, payment_id, amount)."""
+        with self._lock:
+            for ts, drink_id, _, _, amount in facts:
+                if self.ts and ts < self.ts[-1]:
+                    self.ordered = False
+                self.ts.append(ts)
+                self.drink.append(drink_id)
+                self.amount.append(amount)
+
+    def group_by(self, key: str, since_ts: int, until_ts: int):
+        """(cups, satang) per group for sales in [since_ts, until_ts).
+
+        `key` is one of ANALYTICS_GROUPS: hour of day, weekday (Monday = 0)
+        or weekday * 24 + hour.
+        """
+        groups = ANALYTICS_GROUPS[key]
+        cup_drinks = dimensions.cup_drinks
+        with self._lock:
+            if self.ordered:
+                start, end = bisect_left(self.ts, since_ts), bisect_left(self.ts, until_ts)
+            else:
+                start, end = 0, len(self.ts)
+            if np is not None:
+                return self._group_numpy(key, groups, cup_drinks, since_ts, until_ts, start, end)
+            cups, revenue = [0] * groups, [0] * groups
+            for i in range(start, end):
+                ts = self.ts[i]
+                if since_ts <= ts < until_ts:
+                    group = _group_of(key, ts)
+                    cups[group] += self.drink[i] in cup_drinks
+                    revenue[group] += self.amount[i]
+            return cups, revenue
+
+    def _group_numpy(self, key, groups, cup_drinks, since_ts, until_ts, start, end):
+        # The views must not outlive this call: arrays exporting a buffer cannot grow
+        ts = np.frombuffer(self.ts, dtype=np.int64)[start:end]
+        drink = np.frombuffer(self.drink, dtype=np.int32)[start:end]
+        amount = np.frombuffer(self.amount, dtype=np.int64)[start:end]
+        inside = (ts >= since_ts) & (ts < until_ts)
+        ts, drink, amount = ts[inside], drink[inside], amount[inside]
+        group = _group_of(key, ts)
+        is_cup = np.zeros(max(dimensions.drink_names, default=0) + 1)
+        is_cup[list(cup_drinks)] = 1
+        cups = np.bincount(group, weights=is_cup[drink], minlength=groups)
+        revenue = np.bincount(group, weights=amount, minlength=groups)
+        return [int(n) for n in cups], [int(n) for n in revenue]
+
+def _group_of(key: str, ts):
+    """Group number of a timestamp (or a NumPy array of them)."""
+    hour = ts % 86400 // 3600
+    if key == "hour":
+        return hour
+    weekday = (ts // 86400 + 3) % 7
+    return weekday if key == "weekday" else weekday * 24 + hour
+
+sales_columns = SalesColumns()
+
+def get_trend_report(key: str, days: int = ANALYTICS_DAYS):
+    """(start_date, end_date, cups, satang) per group over the last `days` days including today."""
+    last_day = date_to_day(datetime.now().strftime("%Y-%m-%d"))
+    first_day = last_day - days + 1
+    cups, revenue = sales_columns.group_by(key, first_day * 86400, (last_day + 1) * 86400)
+    return day_to_date(first_day), day_to_date(last_day), cups, revenue
+
+# ============================================================================
+# QUICK SALES
+# ============================================================================
+# The main menu starts with the best-selling drink+size pairs for the current
+# time of day; one tap puts the drink in a new cart. Counts live in memory,
+# are bumped by record_sales() after each commit and decay exponentially, so
+# the grid follows what is selling lately without a query per render.
+QUICK_SALE_COUNT = int(os.getenv('QUICK_SALE_COUNT', '4'))  # 0 hides the grid
+QUICK_SALE_SLOT_HOURS = int(os.getenv('QUICK_SALE_SLOT_HOURS', '3'))
+QUICK_SALE_HALF_LIFE_DAYS = float(os.getenv('QUICK_SALE_HALF_LIFE_DAYS', '7'))
+QUICK_SALE_HISTORY_HALF_LIVES = 6  # older sales weigh under 2% and are not loaded at startup
+
+class QuickSales:
+    """Decayed sale counts of (drink_id, size_id) per time-of-day slot.
+
+    Uses forward decay: a sale at time ts adds 2 ** ((ts - base) / half_life),
+    so newer sales outweigh older ones without ever touching the stored
+    counters. When the weights get large everything is rescaled to a newer
+    base (once every few months).
+    """
+
+    def __init__(self, half_life_days: float = QUICK_SALE_HALF_LIFE_DAYS, slot_hours: int = QUICK_SALE_SLOT_HOURS):
+        self._lock = threading.Lock()
+        self.half_life = half_life_days * 86400
+        self.slot_hours = slot_hours
+        self._reset(to_ts(datetime.now()))
+
+    def _reset(self, base: int):
+        self.base = base
+        self.slots = [{} for _ in range((23 // self.slot_hours) + 1)]
+        self.overall = {}  # all slots together, to fill a quiet slot
+
+    def load(self, conn):
+        since = to_ts(datetime.now()) - int(self.half_life * QUICK_SALE_HISTORY_HALF_LIVES)
+        rows = conn.execute('''
+            SELECT ts / 3600, drink_id, size_id, COUNT(*)
+            FROM sales
+            WHERE ts >= ?
+            GROUP BY 1, 2, 3
+        ''', (since,)).fetchall()
+        with self._lock:
+            self._reset(since)
+            for hour, drink_id, size_id, count in rows:
+                if drink_id in dimensions.cup_drinks:
+                    self._add(hour * 3600, (drink_id, size_id), count)
+
+    def add_facts(self, facts):
+        """Count committed sale facts (ts, drink_id, size_id, payment_id, amount); toppings are skipped."""
+        cup_drinks = dimensions.cup_drinks
+        with self._lock:
+            for ts, drink_id, size_id, _, _ in facts:
+                if drink_id in cup_drinks:
+                    self._add(ts, (drink_id, size_id), 1)
+
+    def _add(self, ts: int, key, count: int):
+        if ts - self.base > 64 * self.half_life:
+            self._rebase(ts)
+        weight = count * 2.0 ** ((ts - self.base) / self.half_life)
+        for counts in (self.slots[ts % 86400 // 3600 // self.slot_hours], self.overall):
+            counts[key] = counts.get(key, 0.0) + weight
+
+    def _rebase(self, base: int):
+        scale = 2.0 ** ((self.base - base) / self.half_life)
+        for counts in (*self.slots, self.overall):
+            for key in counts:
+                counts[key] *= scale
+        self.base = base
+
+    def top(self, hour: int, n: int):
+        """The n best (drink_id, size_id) for this hour's slot, topped up from the whole day."""
+        with self._lock:
+            best = [key for key, _ in heapq.nlargest(n, self.slots[hour // self.slot_hours].items(),
+                                                     key=itemgetter(1))]
+            if len(best) < n:
+                best += [key for key, _ in heapq.nlargest(n + len(best), self.overall.items(), key=itemgetter(1))
+                         if key not in best][:n - len(best)]
+        return best
+
+quick_sales = QuickSales()
+
+# ============================================================================
+# ASYNC DATA ACCESS
+# ============================================================================
+# The helpers above are blocking sqlite3 calls. Handlers must never run them
+# directly on the event loop, otherwise one slow report freezes every other
+# cashier's button taps. Writes go through a single dedicated writer thread
+# (keeps sales in order, no lock fights between writers); reports run on a
+# small reader pool.
+DB_READER_THREADS = int(os.getenv('DB_READER_THREADS', '2'))
+SALE_WRITE_RETRIES = int(os.getenv('SALE_WRITE_RETRIES', '5'))
+
+def _timed_call(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+def _log_write_error(future):
+    if future.exception() is not None:
+        print(f"⚠️ Background DB write failed: {future.exception()}")
+
+class SalesRepository:
+    """Awaitable facade over the blocking database helpers."""
+
+    def __init__(self, reader_threads: int = DB_READER_THREADS):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix="db-reader")
+        # One at a time, and off the writer thread so sales are stored during a backup
+        self._backups = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-backup")
+        self.write_behind = None  # SaleBuffer when SALES_WRITE_BEHIND is on
+
+    async def _write(self, func, *args):
+        return await self._run(self._writer, func, *args)
+
+    async def _read(self, func, *args):
+        return await self._run(self._readers, func, *args)
+
+    @staticmethod
+    async def _run(executor, func, *args):
+        """Run a DB helper on `executor`, adding its time to the current update's metrics."""
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(executor, _timed_call, func, *args)
+        db_time = update_db_time.get()
+        if db_time is not None:
+            db_time[0] += elapsed
+        return result
+
+    def persist_session(self, user_id, session):
+        """Queue a session write on the writer thread without waiting for it.
+
+        The single writer keeps these in order; losing the last one in a
+        crash only costs the cashier one tap.
+        """
+        values = None if session is None else (
+            session.category, session.drink, json.dumps(session.items), session.touched, session.sale_key,
+        )
+        future = self._writer.submit(write_session, user_id, values)
+        future.add_done_callback(_log_write_error)
+
+    async def record_sales(self, rows, journal_seq=None):
+        """Commit sale rows, retrying while another process holds the database lock.
+
+        Retrying is safe: a failed transaction is rolled back, and rows with
+        a sale key are never stored twice.
+        """
+        for attempt in range(SALE_WRITE_RETRIES):
+            try:
+                days = await self._write(record_sales, rows, journal_seq)
+                break
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e) or attempt == SALE_WRITE_RETRIES - 1:
+                    raise
+                print(f"⚠️ Database busy, retrying sale write ({attempt + 1}/{SALE_WRITE_RETRIES})")
+                await asyncio.sleep(0.05 * 2 ** attempt)
+        for day in days:
+            report_cache.invalidate_day(day)
+        return days
+
+    async def save_sale(self, drink_name, category, size, price, payment_type, sale_key=None):
+        """Record a sale; in write-behind mode it is only journaled and queued."""
+        row = make_sale_row(drink_name, category, size, price, payment_type, sale_key=sale_key)
+        if self.write_behind is not None:
+            await self.write_behind.add(row)
+        else:
+            await self.record_sales([row])
+        return row[0][:10]
+
+    async def save_order(self, lines, payment_type, order_key):
+        """Record an order and all its lines in one transaction (or one journal batch)."""
+        rows = make_order_rows(lines, payment_type, order_key)
+        if self.write_behind is not None:
+            await self.write_behind.add(*rows)
+        else:
+            await self.record_sales(rows)
+        return rows[0][0][:10]
+
+    async def today_report(self):
+        return await self._read(get_today_report)
+
+    async def week_report(self):
+        return await self._read(get_week_report)
+
+    async def month_report(self):
+        return await self._read(get_month_report)
+
+    async def alltime_report(self):
+        return await self._read(get_alltime_report)
+
+    async def range_report(self, start_date: str, end_date: str):
+        return await self._read(get_range_report, start_date, end_date)
+
+    async def sales_details(self, start_date: str, end_date: str):
+        return await self._read(get_sales_details, start_date, end_date)
+
+    async def trend_report(self, key: str):
+        return await self._read(get_trend_report, key)
+
+    async def export_sales(self, path: str, start_date: Optional[str], end_date: Optional[str], fmt: str):
+        return await self._read(export_sales, path, start_date, end_date, fmt)
+
+    async def archive(self, keep_months: int):
+        """Archive closed months one writer job per month, so sales get in between."""
+        archived = []
+        while True:
+            result = await self._write(archive_oldest_month, keep_months)
+            if result is None:
+                return archived
+            archived.append(result)
+            if not result[1]:
+                return archived
+
+    async def backup(self, keep: int = BACKUP_KEEP):
+        return await self._run(self._backups, backup_database, keep)
+
+    def close(self):
+        """Finish queued DB work, stop the worker threads and close connections."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self._backups.shutdown(wait=True)
+        db_pool.close()
+
+sales_db = SalesRepository()
+
+# ============================================================================
+# WRITE-BEHIND SALE BUFFER
+# ============================================================================
+# Optional (SALES_WRITE_BEHIND=1). A sale is appended to a small journal file
+# and acknowledged to the cashier right away; a background task group-commits
+# queued sales every WRITE_BEHIND_BATCH rows or WRITE_BEHIND_INTERVAL_MS,
+# whichever comes first. Reports see a queued sale once it is flushed.
+SALES_WRITE_BEHIND = os.getenv('SALES_WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_BATCH = int(os.getenv('WRITE_BEHIND_BATCH', '50'))
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv('WRITE_BEHIND_INTERVAL_MS', '500'))
+SALES_JOURNAL_PATH = os.getenv('SALES_JOURNAL_PATH', DB_PATH + '.journal')
+
+def replay_sale_journal(path: str = SALES_JOURNAL_PATH) -> int:
+    """Commit journaled sales left behind by a crash. Returns the number replayed.
+
+    Entries at or below the committed `sale_journal_seq` already reached the
+    database and are skipped.
+    """
+    if not os.path.exists(path):
+        return 0
+    committed = get_meta('sale_journal_seq', 0)
+    pending = []
+    with open(path, encoding="utf-8") as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # torn last line from the crash
+            if entry["seq"] > committed:
+                pending.append(entry)
+    if pending:
+        record_sales([tuple(entry["row"]) for entry in pending], pending[-1]["seq"])
+        print(f"♻️ Replayed {len(pending)} journaled sales")
+    os.remove(path)
+    return len(pending)
+
+class SaleBuffer:
+    """Durable write-behind queue of sale rows with group commit."""
+
+    def __init__(self, repository, journal_path: str = SALES_JOURNAL_PATH,
+                 batch_size: int = WRITE_BEHIND_BATCH, interval_ms: int = WRITE_BEHIND_INTERVAL_MS):
+        self.repository = repository
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self._seq = get_meta('sale_journal_seq', 0)
+        self._pending = []  # (seq, row)
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    async def add(self, *rows):
+        """Journal sales durably and queue them for the next group commit.
+
+        Returns once the journal lines are on disk (one fsync per call, done
+        off the event loop). Rows added together (the lines of an order)
+        always land in the same commit: a flush takes everything queued.
+        """
+        entries = []
+        for row in rows:
+            self._seq += 1
+            entries.append(json.dumps({"seq": self._seq, "row": row}, ensure_ascii=False) + "\n")
+            self._pending.append((self._seq, row))
+        self._journal.write("".join(entries))
+        self._journal.flush()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        await asyncio.get_running_loop().run_in_executor(None, os.fsync, self._journal.fileno())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:  # keep flushing: add() goes on accepting sales
+                print(f"⚠️ Write-behind flush failed, will retry: {e}")
+
+    async def flush(self):
+        """Commit everything queued so far in a single transaction."""
+        if not self._pending:
+            return
+        batch = self._pending
+        self._pending = []
+        try:
+            await self.repository.record_sales([row for _, row in batch], batch[-1][0])
+        except Exception:
+            self._pending = batch + self._pending
+            raise
+        if not self._pending:
+            self._journal.truncate(0)
+
+    async def close(self):
+        """Stop the flusher and drain the queue.
+
+        The journal is removed only once everything is committed; otherwise it
+        is replayed on the next start.
+        """
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        try:
+            await self.flush()
+        finally:
+            self._journal.close()
+        os.remove(self.journal_path)
+
+# ============================================================================
+# USER SESSION STORAGE
+# ============================================================================
+# In-progress sales live in memory, bounded by an idle TTL and a maximum
+# entry count (least recently used sessions are evicted first). With
+# SESSION_PERSIST=1 they are also written through to the `sessions` table so
+# a restart mid-sale does not make the cashier start over.
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '1800'))
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '1000'))
+SESSION_PERSIST = os.getenv('SESSION_PERSIST', '0') == '1'
+SESSION_TOUCH_SAVE_SECONDS = 60  # a read-only tap rewrites `touched` at most this often
+
+class Session:
+    """One cashier's order in progress.
+
+    `category` and `drink` are the MENU_INDEX positions being picked;
+    `items` is the cart, one list of [category, drink, size] picks per
+    drink: the drink first, then its toppings. `sale_key` identifies the
+    order, so paying for it twice stores it once.
+    """
+    __slots__ = ("category", "drink", "items", "touched", "sale_key")
+
+    def __init__(self, category=None, drink=None, items=None, touched=0.0, sale_key=None):
+        self.category = category
+        self.drink = drink
+        self.items = items if items is not None else []
+        self.touched = touched
+        self.sale_key = sale_key or uuid.uuid4().hex
+
+class SessionStore:
+    """Bounded LRU map of user id -> Session with idle-TTL expiry."""
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist = None  # callable(user_id, session or None) in persistent mode
+        self._sessions = OrderedDict()
+        self._saved = {}  # user id -> `touched` last written to storage
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user_id) -> Session:
+        """Get or create a user's session and mark it as recently used."""
+        now = time.time()
+        session = self._sessions.get(user_id)
+        if session is not None and now - session.touched > self.ttl:
+            session = None  # idle too long, the sale was abandoned
+        if session is None:
+            session = Session()
+            self._sessions[user_id] = session
+        else:
+            self._sessions.move_to_end(user_id)
+        session.touched = now
+        # A session that is only looked at must not expire early after a
+        # restart; its stored `touched` lags by at most SESSION_TOUCH_SAVE_SECONDS.
+        if user_id in self._saved and now - self._saved[user_id] >= SESSION_TOUCH_SAVE_SECONDS:
+            self.save(user_id)
+        self._evict(now)
+        return session
+
+    def save(self, user_id):
+        """Write a changed session through to storage (persistent mode only)."""
+        if self.persist is not None and user_id in self._sessions:
+            session = self._sessions[user_id]
+            self.persist(user_id, session)
+            self._saved[user_id] = session.touched
+
+    def clear(self, user_id):
+        self._saved.pop(user_id, None)
+        if self._sessions.pop(user_id, None) is not None and self.persist is not None:
+            self.persist(user_id, None)
+
+    def load(self, rows):
+        """Restore persisted sessions, oldest first: (user_id, category, drink, items, touched, sale_key)."""
+        for user_id, *values in rows:
+            session = self._sessions[user_id] = Session(*values)
+            self._saved[user_id] = session.touched
+        self._evict(time.time())
+
+    def _evict(self, now: float):
+        # Entries are kept in last-used order, so expired and least recently
+        # used sessions are always at the front.
+        while self._sessions:
+            user_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_entries and now - oldest.touched <= self.ttl:
+                break
+            self.clear(user_id)
+
+sessions = SessionStore()
+
+def get_session(user_id) -> Session:
+    """Get or create a session for a user."""
+    return sessions.get(user_id)
+
+def save_session(user_id):
+    """Persist a user's session after it changed."""
+    sessions.save(user_id)
+
+def clear_session(user_id):
+    """Clear a user's session."""
+    sessions.clear(user_id)
+
+# ============================================================================
+# SALE DEDUPLICATION
+# ============================================================================
+# A double-tapped "pay" button or a callback Telegram redelivers after a slow
+# save arrives once the session is already cleared. Recently paid callbacks
+# and sale messages are remembered for a short window so such repeats are
+# acknowledged instead of starting a new sale; the unique sale key in the
+# sales table catches anything that outlives the window (e.g. a restart).
+SALE_DEDUPE_SECONDS = int(os.getenv('SALE_DEDUPE_SECONDS', '120'))
+
+class RecentSales:
+    """Short-lived set of keys that already produced a saved sale."""
+
+    def __init__(self, window: float = SALE_DEDUPE_SECONDS):
+        self.window = window
+        self._seen = OrderedDict()  # key -> time remembered
+
+    def add(self, *keys):
+        now = time.time()
+        for key in keys:
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+        while self._seen and now - next(iter(self._seen.values())) > self.window:
+            self._seen.popitem(last=False)
+
+    def __contains__(self, key):
+        seen = self._seen.get(key)
+        return seen is not None and time.time() - seen <= self.window
+
+    def discard(self, key):
+        self._seen.pop(key, None)
+
+recent_sales = RecentSales()
+
+def sale_message_key(callback: types.CallbackQuery):
+    """Identity of the message a sale was built on (a chat message or an inline one)."""
+    if callback.message is None:
+        return ("inline", callback.inline_message_id)
+    return ("message", callback.message.chat.id, callback.message.message_id)
+
+# ============================================================================
+# KEYBOARD BUILDERS
+# ============================================================================
+# Every keyboard is built once at startup (see COMPILED MENU below) and the
+# same objects are reused for every tap; nothing here runs on the hot path.
+def _build_main_keyboard(is_admin: bool, quick=()):
+    """Create the main menu keyboard, led by quick-sale buttons for `quick` [category, drink, size] picks."""
+    rows = [
+        [InlineKeyboardButton(text=f"⚡ {MENU_INDEX[c].drinks[d].name} ({MENU_INDEX[c].drinks[d].sizes[z]})",
+                              callback_data=f"quick:{c}:{d}:{z}")]
+        for c, d, z in quick
+    ]
+    rows += [
+        [InlineKeyboardButton(text="🆕 ขายใหม่ / New sale", callback_data="new_sale")],
+        [InlineKeyboardButton(text="📊 รายงานวันนี้ / Today report", callback_data="today_report")]
+    ]
+    if is_admin:
+        rows.append([InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def _build_admin_keyboard():
+    """Create the admin menu keyboard."""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📊 รายงานวันนี้ / Today Report", callback_data="today_report")],
         [InlineKeyboardButton(text="📆 รายงานรายสัปดาห์ / Weekly Report", callback_data="week_report")],
         [InlineKeyboardButton(text="📅 รายงานประจำเดือน / Monthly Report", callback_data="month_report")],
         [InlineKeyboardButton(text="🗂 รายงานทั้งหมด / All-time Report", callback_data="alltime_report")],
+        [InlineKeyboardButton(text="🗓 ช่วงวันที่ / Date Range", callback_data="date_range")],
+        [InlineKeyboardButton(text="🕒 รายชั่วโมง / Hourly", callback_data="hourly_report"),
+         InlineKeyboardButton(text="📈 วันในสัปดาห์ / Weekdays", callback_data="weekday_report")],
         [InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="back_to_main")]
     ])
     return keyboard
 
-def get_category_keyboard():
-    """Create keyboard for category selection."""
+def _build_category_keyboard(categories, cart: bool = False):
+    """Create keyboard for category selection (with a way back to the cart when adding to one)."""
     buttons = []
-    categories = list(MENU.keys())
     for idx, category in enumerate(categories):
         buttons.append([
             InlineKeyboardButton(
@@ -343,51 +2569,617 @@ def get_category_keyboard():
                 callback_data=f"cat:{idx}"   # короткий ID
             )
         ])
+    if cart:
+        buttons.append([InlineKeyboardButton(text="🛒 กลับไปตะกร้า / Back to cart", callback_data="back_to_cart")])
     buttons.append([InlineKeyboardButton(text="❌ ยกเลิก / Cancel", callback_data="cancel")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_drink_keyboard(category):
+def _build_drink_keyboard(drinks):
     """Create keyboard for drink selection within a category."""
     buttons = []
-    if category in MENU:
-        drinks = list(MENU[category].keys())
-        for idx, drink in enumerate(drinks):
-            buttons.append([
-                InlineKeyboardButton(
-                    text=drink,
-                    callback_data=f"drink:{idx}"   # короткий ID
-                )
-            ])
+    for idx, drink in enumerate(drinks):
+        buttons.append([
+            InlineKeyboardButton(
+                text=drink,
+                callback_data=f"drink:{idx}"   # короткий ID
+            )
+        ])
     buttons.append([InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="back_to_category")])
     buttons.append([InlineKeyboardButton(text="❌ ยกเลิก / Cancel", callback_data="cancel")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_size_keyboard(category, drink):
+def _build_size_keyboard(sizes):
     """Create keyboard for size selection."""
     buttons = []
-    if category in MENU and drink in MENU[category]:
-        sizes = list(MENU[category][drink].keys())
-        for idx, size in enumerate(sizes):
-            buttons.append([
-                InlineKeyboardButton(
-                    text=size,
-                    callback_data=f"size:{idx}"   # короткий ID
-                )
-            ])
+    for idx, size in enumerate(sizes):
+        buttons.append([
+            InlineKeyboardButton(
+                text=size,
+                callback_data=f"size:{idx}"   # короткий ID
+            )
+        ])
     buttons.append([InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="back_to_drink")])
     buttons.append([InlineKeyboardButton(text="❌ ยกเลิก / Cancel", callback_data="cancel")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_payment_keyboard():
-    """Create keyboard for payment type selection."""
+def _build_topping_keyboard(toppings):
+    """Create keyboard for adding a topping to the last drink in the cart."""
+    buttons = [[InlineKeyboardButton(text=topping, callback_data=f"top:{idx}")]
+               for idx, topping in enumerate(toppings)]
+    buttons.append([InlineKeyboardButton(text="🛒 กลับไปตะกร้า / Back to cart", callback_data="back_to_cart")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def _build_cart_keyboard(toppings: bool):
+    """Create keyboard of the cart: add items, or pay for the whole order."""
+    add_row = [InlineKeyboardButton(text="🧋 เพิ่มเครื่องดื่ม / Add drink", callback_data="add_drink")]
+    if toppings:
+        add_row.append(InlineKeyboardButton(text="➕ ท็อปปิ้ง / Topping", callback_data="add_topping"))
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="💵 เงินสด / Cash", callback_data="pay:cash")],
-        [InlineKeyboardButton(text="📱 คิวอาร์ / QR", callback_data="pay:qr")],
+        add_row,
+        [InlineKeyboardButton(text="↩️ ลบรายการล่าสุด / Remove last", callback_data="remove_last")],
+        [InlineKeyboardButton(text="💵 เงินสด / Cash", callback_data="pay:cash"),
+         InlineKeyboardButton(text="📱 คิวอาร์ / QR", callback_data="pay:qr")],
         [InlineKeyboardButton(text="❌ ยกเลิก / Cancel", callback_data="cancel")]
     ])
     return keyboard
 
+# ============================================================================
+# COMPILED MENU
+# ============================================================================
+# MENU compiled into index tuples (category id -> drinks, drink id -> sizes
+# and prices) with the keyboard and step text of every sale screen, so the
+# cat:/drink:/size: callbacks are plain tuple lookups.
+class CompiledDrink(NamedTuple):
+    name: str
+    sizes: tuple               # size names by size id
+    prices: tuple              # prices by size id
+    size_keyboard: InlineKeyboardMarkup
+    size_step_text: str
+
+class CompiledCategory(NamedTuple):
+    name: str
+    drinks: tuple              # CompiledDrink by drink id
+    drink_keyboard: InlineKeyboardMarkup
+    drink_step_text: str
+
+def compile_menu(menu) -> tuple:
+    """Compile the MENU dict into a tuple of CompiledCategory, indexed by category id."""
+    compiled = []
+    for category, drinks in menu.items():
+        compiled_drinks = []
+        for drink, sizes in drinks.items():
+            header = (
+                f"🆕 ขายใหม่ / New Sale\n\n"
+                f"หมวดหมู่ / Category: {category}\n"
+                f"เครื่องดื่ม / Drink: {drink}\n"
+            )
+            compiled_drinks.append(CompiledDrink(
+                name=drink,
+                sizes=tuple(sizes),
+                prices=tuple(sizes.values()),
+                size_keyboard=_build_size_keyboard(sizes),
+                size_step_text=header + "\nขั้นที่ 3: เลือกขนาด\nStep 3: Choose size:",
+            ))
+        compiled.append(CompiledCategory(
+            name=category,
+            drinks=tuple(compiled_drinks),
+            drink_keyboard=_build_drink_keyboard(drinks),
+            drink_step_text=f"🆕 ขายใหม่ / New Sale\n\nหมวดหมู่ / Category: {category}\n\nขั้นที่ 2: เลือกเครื่องดื่ม\nStep 2: Choose drink:",
+        ))
+    return tuple(compiled)
+
+MENU_INDEX = compile_menu(MENU)
+MAIN_KEYBOARDS = {False: _build_main_keyboard(False), True: _build_main_keyboard(True)}
+ADMIN_KEYBOARD = _build_admin_keyboard()
+CATEGORY_KEYBOARD = _build_category_keyboard(MENU)
+CART_CATEGORY_KEYBOARD = _build_category_keyboard(MENU, cart=True)
+TOPPINGS_INDEX = next((idx for idx, category in enumerate(MENU_INDEX) if category.name == TOPPINGS_CATEGORY), None)
+TOPPING_KEYBOARD = None if TOPPINGS_INDEX is None else _build_topping_keyboard(MENU[TOPPINGS_CATEGORY])
+CART_KEYBOARD = _build_cart_keyboard(TOPPINGS_INDEX is not None)
+
+MENU_POSITIONS = {
+    (category.name, drink.name): (category_idx, drink_idx)
+    for category_idx, category in enumerate(MENU_INDEX)
+    for drink_idx, drink in enumerate(category.drinks)
+}
+QUICK_KEYBOARDS = {}  # (picks, is_admin) -> keyboard; the top sellers rarely change order
+
+@lru_cache(maxsize=None)
+def _quick_pick(drink_id: int, size_id: int):
+    """[category, drink, size] MENU_INDEX position of dimension ids, or None if it is off the menu."""
+    for (category, drink), known_id in dimensions.drinks.items():
+        if known_id == drink_id:
+            position = MENU_POSITIONS.get((category, drink))
+            break
+    else:
+        return None
+    if position is None:
+        return None
+    sizes = MENU_INDEX[position[0]].drinks[position[1]].sizes
+    for size_idx, size in enumerate(sizes):
+        if dimensions.sizes.get(size) == size_id:
+            return (*position, size_idx)
+    return None
+
+def get_main_keyboard(is_admin: bool):
+    """Return the main menu keyboard, with this hour's best sellers on top."""
+    if not QUICK_SALE_COUNT:
+        return MAIN_KEYBOARDS[is_admin]
+    top = quick_sales.top(datetime.now().hour, QUICK_SALE_COUNT)
+    picks = tuple(pick for pick in (_quick_pick(*key) for key in top) if pick is not None)
+    keyboard = QUICK_KEYBOARDS.get((picks, is_admin))
+    if keyboard is None:
+        if len(QUICK_KEYBOARDS) >= 64:
+            QUICK_KEYBOARDS.clear()
+        keyboard = QUICK_KEYBOARDS[picks, is_admin] = _build_main_keyboard(is_admin, picks)
+    return keyboard
+
+def get_admin_keyboard():
+    """Return the admin menu keyboard."""
+    return ADMIN_KEYBOARD
+
+# ============================================================================
+# CART
+# ============================================================================
+# A customer's order is built on one message: every size or topping tap
+# lands back on the cart screen with the running total, and paying saves
+# the whole cart as one order in a single transaction.
+def _pick(pick):
+    """(CompiledCategory, CompiledDrink, size, price) of a [category, drink, size] pick."""
+    category_idx, drink_idx, size_idx = pick
+    category = MENU_INDEX[category_idx]
+    drink = category.drinks[drink_idx]
+    return category, drink, drink.sizes[size_idx], drink.prices[size_idx]
+
+def add_to_cart(session: Session, pick):
+    """Add a pick: a topping goes onto the last drink, anything else is a new item."""
+    if pick[0] == TOPPINGS_INDEX and session.items:
+        session.items[-1].append(list(pick))
+    else:
+        session.items.append([list(pick)])
+
+def remove_last(session: Session):
+    """Take back the last pick (a topping, or a drink without toppings)."""
+    if session.items:
+        session.items[-1].pop()
+        if not session.items[-1]:
+            session.items.pop()
+
+def cart_lines(session: Session):
+    """Order lines (order_item, drink, category, size, price); a drink's toppings share its number."""
+    return [(order_item, drink.name, category.name, size, price)
+            for order_item, item in enumerate(session.items, start=1)
+            for category, drink, size, price in map(_pick, item)]
+
+def format_cart(lines) -> str:
+    """Cart lines with toppings indented under their drink, and the total."""
+    rows = []
+    previous = None
+    for order_item, drink, _, size, price in lines:
+        if order_item == previous:
+            rows.append(f"   + {drink}  {price} บาท")
+        else:
+            rows.append(f"{order_item}. {drink} ({size})  {price} บาท")
+        previous = order_item
+    total = sum(line[4] for line in lines)
+    return "\n".join(rows) + f"\n\nรวม / Total: {total} บาท / THB"
+
+def cart_view(session: Session) -> str:
+    return (
+        "🛒 ตะกร้า / Cart\n\n"
+        + format_cart(cart_lines(session))
+        + "\n\nเลือกวิธีชำระเงิน หรือเพิ่มรายการ\nChoose payment type or add more items:"
+    )
+
+# ============================================================================
+# INLINE DRINK SEARCH
+# ============================================================================
+# Typing "@<bot> pass" in a chat lists matching drinks and sizes; choosing one
+# posts a message with Cash/QR buttons that record the sale. The index and
+# every result are compiled from MENU once at startup, so a keystroke costs
+# a few dict and set operations, never a walk over the menu.
+INLINE_MAX_RESULTS = 20  # Telegram accepts up to 50
+INLINE_CACHE_SECONDS = 300
+
+def _ngrams(text: str, n: int = 3):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class MenuSearch:
+    """Search drinks by any part of their Thai or English name.
+
+    Queries of three or more letters go through a trigram index (candidates
+    are the intersection of the query's trigram postings, then checked with
+    a substring test); shorter ones through a map of one- and two-letter word
+    prefixes. Words are matched independently, so "soda pass" works. When
+    nothing matches exactly, drinks sharing most of the query's trigrams
+    are returned instead, which absorbs a typo or two.
+    """
+
+    def __init__(self, menu_index):
+        self.entries = []  # entry id -> (category idx, drink idx)
+        self.texts = []    # entry id -> searchable name
+        self.words = []    # entry id -> words of the name
+        self.prefixes = {}  # 1-2 letter word prefix -> [entry ids]
+        self.grams = {}     # trigram -> {entry ids}
+        for category_idx, category in enumerate(menu_index):
+            for drink_idx, drink in enumerate(category.drinks):
+                entry = len(self.entries)
+                text = _menu_key(drink.name)
+                words = text.replace("/", " ").replace("&", " ").split()
+                self.entries.append((category_idx, drink_idx))
+                self.texts.append(text)
+                self.words.append(words)
+                for prefix in {word[:n] for word in words for n in (1, 2)}:
+                    self.prefixes.setdefault(prefix, []).append(entry)
+                for gram in _ngrams(text):
+                    self.grams.setdefault(gram, set()).add(entry)
+
+    def _exact(self, token: str):
+        if len(token) < 3:
+            return set(self.prefixes.get(token, ()))
+        postings = sorted((self.grams.get(gram, set()) for gram in _ngrams(token)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {entry for entry in candidates if token in self.texts[entry]}
+
+    def _fuzzy(self, tokens):
+        scores = Counter()
+        wanted = set()
+        for token in tokens:
+            grams = _ngrams(token)
+            wanted |= grams
+            for gram in grams:
+                scores.update(self.grams.get(gram, ()))
+        needed = max(1, (len(wanted) + 1) // 2)
+        return [entry for entry, score in sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+                if score >= needed]
+
+    def search(self, query: str, limit: int = INLINE_MAX_RESULTS):
+        """(category idx, drink idx) of the best matches, word-prefix matches first."""
+        tokens = _menu_key(query).split()
+        if not tokens:
+            return self.entries[:limit]
+        found = self._exact(tokens[0])
+        for token in tokens[1:]:
+            if not found:
+                break
+            found &= self._exact(token)
+        if found:
+            ranked = sorted(found, key=lambda entry: (
+                not all(any(word.startswith(token) for word in self.words[entry]) for token in tokens),
+                entry,
+            ))
+        else:
+            ranked = self._fuzzy(tokens)
+        return [self.entries[entry] for entry in ranked[:limit]]
+
+def _build_inline_results(menu_index):
+    """One prebuilt inline article per drink and size, with its pay buttons."""
+    results = {}
+    for category_idx, category in enumerate(menu_index):
+        for drink_idx, drink in enumerate(category.drinks):
+            articles = []
+            for size_idx, (size, price) in enumerate(zip(drink.sizes, drink.prices)):
+                sale = f"{category_idx}:{drink_idx}:{size_idx}"
+                articles.append(types.InlineQueryResultArticle(
+                    id=sale,
+                    title=f"{drink.name} - {size}",
+                    description=f"{price} บาท / THB · {category.name}",
+                    input_message_content=types.InputTextMessageContent(message_text=(
+                        f"🧋 {drink.name}\n"
+                        f"ขนาด / Size: {size}\n"
+                        f"ราคา / Price: {price} บาท / THB\n\n"
+                        f"เลือกวิธีชำระเงิน\nChoose payment type:"
+                    )),
+                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                        InlineKeyboardButton(text="💵 เงินสด / Cash", callback_data=f"ipay:{sale}:cash"),
+                        InlineKeyboardButton(text="📱 คิวอาร์ / QR", callback_data=f"ipay:{sale}:qr"),
+                    ]]),
+                ))
+            results[category_idx, drink_idx] = articles
+    return results
+
+MENU_SEARCH = MenuSearch(MENU_INDEX)
+INLINE_RESULTS = _build_inline_results(MENU_INDEX)
+
+def search_menu(query: str):
+    """Inline results for a query: every size of the matching drinks, best drinks first."""
+    results = []
+    for drink in MENU_SEARCH.search(query):
+        results.extend(INLINE_RESULTS[drink])
+        if len(results) >= INLINE_MAX_RESULTS:
+            break
+    return results[:INLINE_MAX_RESULTS]
+
+def parse_menu_pick(raw: str):
+    """Parse "category:drink:size" MENU_INDEX positions from a button."""
+    category_idx, drink_idx, size_idx = map(int, raw.split(":"))
+    if (not 0 <= category_idx < len(MENU_INDEX)
+            or not 0 <= drink_idx < len(MENU_INDEX[category_idx].drinks)
+            or not 0 <= size_idx < len(MENU_INDEX[category_idx].drinks[drink_idx].sizes)):
+        raise ValueError(raw)
+    return category_idx, drink_idx, size_idx
+
+def parse_payment(raw: str) -> str:
+    """Parse the payment type of a pay button; callback data is client-controlled."""
+    if raw not in PAYMENT_TYPES:
+        raise ValueError(raw)
+    return raw
+
+def parse_inline_sale(raw: str):
+    """Parse "category:drink:size:payment" from an inline sale button."""
+    pick, _, payment_type = raw.rpartition(":")
+    return (*parse_menu_pick(pick), parse_payment(payment_type))
+
+# ============================================================================
+# REPORT RENDERING
+# ============================================================================
+def _details_lines(details) -> str:
+    """Format drink-by-drink rows of a details report."""
+    if not details:
+        return "ไม่มีข้อมูลการขาย / No sales data"
+    text = ""
+    for drink_name, count, total in details:
+        text += f"{drink_name}: {count} แก้ว / {count} cups – {total:,.2f} บาท / {total:,.2f} THB\n"
+    return text
+
+@lru_cache(maxsize=None)
+def _report_keyboard(kind: str, admin: bool):
+    """Keyboard under a report (built once per kind and admin flag)."""
+    details_row = [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data=f"details:{kind}")]
+    if kind == "today":
+        keyboard_rows = [details_row, [InlineKeyboardButton(text="🆕 ขายใหม่ / New sale", callback_data="new_sale")]]
+        if admin:
+            keyboard_rows.append([InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard_rows)
+    # Add Details button
+    return InlineKeyboardMarkup(inline_keyboard=[details_row] + list(ADMIN_KEYBOARD.inline_keyboard))
+
+@lru_cache(maxsize=None)
+def _details_keyboard(kind: str, admin: bool):
+    """Keyboard under a details report (built once per kind and admin flag)."""
+    keyboard_rows = [[InlineKeyboardButton(text="🔙 กลับ / Back", callback_data=f"{kind}_report")]]
+    if admin or kind != "today":
+        keyboard_rows.append([InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard_rows)
+
+async def _build_report(kind: str, admin: bool):
+    """Query and format a today/week/month/alltime report."""
+    if kind == "today":
+        today, count, total = await sales_db.today_report()
+        report_text = (
+            f"📊 รายงานวันนี้ / Today report\n"
+            f"วันที่: {today} / Date: {today}\n\n"
+            f"ยอดขาย: {count} แก้ว / {count} cups\n"
+            f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
+        )
+        return report_text, _report_keyboard(kind, admin)
+
+    if kind == "week":
+        start_date, end_date, count, total = await sales_db.week_report()
+        report_text = (
+            f"📆 รายงานรายสัปดาห์ / Weekly report\n"
+            f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+            f"ยอดขาย: {count} แก้ว / {count} cups\n"
+            f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
+        )
+    elif kind == "month":
+        start_date, end_date, count, total = await sales_db.month_report()
+        report_text = (
+            f"📅 รายงานประจำเดือนนี้ / This month report\n"
+            f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+            f"ยอดขาย: {count} แก้ว / {count} cups\n"
+            f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
+        )
+    else:
+        start_date, end_date, count, total = await sales_db.alltime_report()
+        report_text = (
+            f"🗂 รายงานทั้งหมด / All-time report\n"
+            f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+            f"ยอดขายรวม: {count} แก้ว / {count} cups\n"
+            f"ยอดรวมทั้งหมด: {total:,.2f} บาท / {total:,.2f} THB"
+        )
+
+    return report_text, _report_keyboard(kind, admin)
+
+async def _build_details(kind: str, admin: bool):
+    """Query and format the drink-by-drink breakdown for a report."""
+    keyboard = _details_keyboard(kind, admin)
+    if kind == "today":
+        today, _, _ = await sales_db.today_report()
+        details = await sales_db.sales_details(today, today)
+        detail_text = f"📋 รายละเอียดยอดขายวันนี้ / Today sales details\nวันที่: {today} / Date: {today}\n\n"
+        return detail_text + _details_lines(details), keyboard
+
+    if kind == "week":
+        start_date, end_date, _, _ = await sales_db.week_report()
+        title = "📆 รายละเอียดรายสัปดาห์ / Weekly sales details"
+    elif kind == "month":
+        start_date, end_date, _, _ = await sales_db.month_report()
+        title = "📅 รายละเอียดประจำเดือน / Monthly sales details"
+    else:
+        start_date, end_date, _, _ = await sales_db.alltime_report()
+        if start_date == "N/A":
+            return "ไม่มีข้อมูลการขาย / No sales data available", keyboard
+        title = "🗂 รายละเอียดทั้งหมด / All-time sales details"
+
+    details = await sales_db.sales_details(start_date, end_date)
+    detail_text = f"{title}\nช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+    return detail_text + _details_lines(details), keyboard
+
+async def _cached(key, build):
+    """Serve a rendered report from the report cache, building it on a miss."""
+    cached = report_cache.get(key)
+    if cached is not None:
+        return cached
+    version = report_cache.version
+    rendered = await build()
+    report_cache.put(key, rendered, version)
+    return rendered
+
+async def render_report(kind: str, admin: bool, details: bool = False):
+    """Return (text, reply_markup) for a report, served from the report cache when possible."""
+    start_date, end_date = report_period(kind)
+    key = ((f"details:{kind}" if details else kind), start_date, end_date, admin)
+    builder = _build_details if details else _build_report
+    return await _cached(key, partial(builder, kind, admin))
+
+# ---------- trend reports ----------
+HEAT_LEVELS = ("⬜", "🟨", "🟧", "🟥")
+
+def _bar(value, top, width: int = 10) -> str:
+    return "▇" * round(width * value / top) if top else ""
+
+async def _build_hourly():
+    """Weekday x hour heatmap of cups plus the busiest hours, over the analytics window."""
+    start_date, end_date, cups, revenue = await sales_db.trend_report("weekday_hour")
+    text = (
+        f"🕒 ยอดขายรายชั่วโมง / Hourly heatmap\n"
+        f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+    )
+    hours = [hour for hour in range(24) if any(cups[weekday * 24 + hour] for weekday in range(7))]
+    if not hours:
+        return text + "ไม่มีข้อมูลการขาย / No sales data", ADMIN_KEYBOARD
+
+    first, last = hours[0], hours[-1]
+    top = max(cups)
+    text += f"แก้วต่อชั่วโมง / Cups per hour, {first:02d}:00–{last:02d}:59\n"
+    for weekday, name in enumerate(WEEKDAY_NAMES):
+        cells = "".join(
+            HEAT_LEVELS[min(3, -(-cups[weekday * 24 + hour] * 3 // top))]
+            for hour in range(first, last + 1)
+        )
+        text += f"{cells} {name}\n"
+    text += f"⬜ 0  🟨 ≤{top // 3}  🟧 ≤{top * 2 // 3}  🟥 ≤{top}\n\n"
+
+    by_hour = [(sum(cups[weekday * 24 + hour] for weekday in range(7)),
+                sum(revenue[weekday * 24 + hour] for weekday in range(7)) / 100, hour)
+               for hour in range(24)]
+    text += "ชั่วโมงขายดี / Busiest hours:\n"
+    for count, total, hour in sorted(by_hour, reverse=True)[:5]:
+        if count or total:
+            text += f"{hour:02d}:00 – {count} แก้ว / cups – {total:,.2f} บาท / THB\n"
+    return text, ADMIN_KEYBOARD
+
+async def _build_weekdays():
+    """Total and average-per-day sales by weekday over the analytics window."""
+    start_date, end_date, cups, revenue = await sales_db.trend_report("weekday")
+    text = (
+        f"📈 เทียบวันในสัปดาห์ / Weekday comparison\n"
+        f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+    )
+    if not any(revenue):
+        return text + "ไม่มีข้อมูลการขาย / No sales data", ADMIN_KEYBOARD
+
+    first_day, last_day = date_to_day(start_date), date_to_day(end_date)
+    days_per_weekday = [0] * 7
+    for day in range(first_day, last_day + 1):
+        days_per_weekday[(day + 3) % 7] += 1
+    averages = [revenue[weekday] / 100 / days_per_weekday[weekday] if days_per_weekday[weekday] else 0
+                for weekday in range(7)]
+    top = max(averages)
+    for weekday, name in enumerate(WEEKDAY_NAMES):
+        text += (
+            f"{name}: {cups[weekday]} แก้ว / cups – {revenue[weekday] / 100:,.2f} บาท / THB\n"
+            f"{_bar(averages[weekday], top)} เฉลี่ย / avg {averages[weekday]:,.2f} บาท/วัน / THB/day\n"
+        )
+    return text, ADMIN_KEYBOARD
+
+async def render_trend(kind: str):
+    """Return (text, reply_markup) for the hourly or weekday admin report."""
+    last_day = date_to_day(datetime.now().strftime("%Y-%m-%d"))
+    key = (kind, day_to_date(last_day - ANALYTICS_DAYS + 1), day_to_date(last_day), True)
+    return await _cached(key, _build_hourly if kind == "hourly" else _build_weekdays)
+
+# ---------- date range reports ----------
+THAI_MONTHS = ("ม.ค.", "ก.พ.", "มี.ค.", "เม.ย.", "พ.ค.", "มิ.ย.",
+               "ก.ค.", "ส.ค.", "ก.ย.", "ต.ค.", "พ.ย.", "ธ.ค.")
+WEEKDAY_ROW = [InlineKeyboardButton(text=day, callback_data="noop")
+               for day in ("Mo", "Tu", "We", "Th", "Fr", "Sa", "Su")]
+
+def parse_date_range(raw: str):
+    """'YYYY-MM-DD:YYYY-MM-DD' (or one date) -> (start, end) in order; ValueError if malformed."""
+    dates = [datetime.strptime(part, "%Y-%m-%d").strftime("%Y-%m-%d") for part in raw.split(":")]
+    if not 1 <= len(dates) <= 2:
+        raise ValueError(raw)
+    return min(dates), max(dates)
+
+def parse_calendar(raw: str):
+    """Calendar callback payload -> (month shown 'YYYY-MM', chosen first day or None).
+
+    'YYYY-MM' picks the first day, 'YYYY-MM-DD' is a chosen first day and
+    'YYYY-MM-DD:YYYY-MM' shows another month while picking the last day.
+    """
+    first, _, month = raw.partition(":")
+    if len(first) == 7:
+        return datetime.strptime(first, "%Y-%m").strftime("%Y-%m"), None
+    start = datetime.strptime(first, "%Y-%m-%d").strftime("%Y-%m-%d")
+    return (datetime.strptime(month, "%Y-%m").strftime("%Y-%m") if month else start[:7]), start
+
+def _shift_month(month: str, delta: int) -> str:
+    year, number = divmod(int(month[:4]) * 12 + int(month[5:]) - 1 + delta, 12)
+    return f"{year:04d}-{number + 1:02d}"
+
+def calendar_view(month: str, start: Optional[str]):
+    """(text, keyboard) of the date picker for `month`; picks the last day once `start` is set."""
+    year, number = int(month[:4]), int(month[5:])
+    prefix = f"cal:{start}:" if start else "cal:"
+    rows = [[
+        InlineKeyboardButton(text="◀️", callback_data=prefix + _shift_month(month, -1)),
+        InlineKeyboardButton(text=f"{THAI_MONTHS[number - 1]} / {calendar.month_abbr[number]} {year}",
+                             callback_data="noop"),
+        InlineKeyboardButton(text="▶️", callback_data=prefix + _shift_month(month, 1)),
+    ], WEEKDAY_ROW]
+    for week in calendar.Calendar().monthdayscalendar(year, number):
+        row = []
+        for day in week:
+            date = f"{month}-{day:02d}"
+            if not day or (start and date < start):
+                row.append(InlineKeyboardButton(text=" ", callback_data="noop"))
+            elif start:
+                row.append(InlineKeyboardButton(text=str(day), callback_data=f"range:{start}:{date}"))
+            else:
+                row.append(InlineKeyboardButton(text=str(day), callback_data=f"cal:{date}"))
+        rows.append(row)
+    rows.append([InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="admin_menu")])
+    if start:
+        text = f"🗓 จาก / From: {start}\nเลือกวันสุดท้าย / Choose the last day"
+    else:
+        text = "🗓 เลือกวันแรก / Choose the first day"
+    return text, InlineKeyboardMarkup(inline_keyboard=rows)
+
+async def _build_range(start_date: str, end_date: str):
+    _, _, count, total = await sales_db.range_report(start_date, end_date)
+    report_text = (
+        f"🗓 รายงานช่วงวันที่ / Date range report\n"
+        f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+        f"ยอดขาย: {count} แก้ว / {count} cups\n"
+        f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
+    )
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data=f"rdet:{start_date}:{end_date}")],
+        [InlineKeyboardButton(text="🗓 ช่วงอื่น / Another range", callback_data=f"cal:{start_date[:7]}")],
+    ] + list(ADMIN_KEYBOARD.inline_keyboard))
+    return report_text, keyboard
+
+async def _build_range_details(start_date: str, end_date: str):
+    details = await sales_db.sales_details(start_date, end_date)
+    detail_text = (
+        f"🗓 รายละเอียดช่วงวันที่ / Date range sales details\n"
+        f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
+    )
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔙 กลับ / Back", callback_data=f"range:{start_date}:{end_date}")],
+        [InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")],
+    ])
+    return detail_text + _details_lines(details), keyboard
+
+async def render_range(start_date: str, end_date: str, details: bool = False):
+    """Return (text, reply_markup) for an admin report over any whole days."""
+    key = (("range:details" if details else "range"), start_date, end_date, True)
+    builder = _build_range_details if details else _build_range
+    return await _cached(key, partial(builder, start_date, end_date))
+
 # ============================================================================
 # BOT HANDLERS
 # ============================================================================
@@ -407,90 +3199,41 @@ async def cmd_start(message: types.Message):
 
 async def cmd_report(message: types.Message):
     """Handle /report command (today)."""
-    today, count, total = get_today_report()
-    report_text = (
-        f"📊 รายงานวันนี้ / Today report\n"
-        f"วันที่: {today} / Date: {today}\n\n"
-        f"ยอดขาย: {count} แก้ว / {count} cups\n"
-        f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
-    )
     admin = is_admin_user(message.from_user)
-    
-    # Add Details button
-    keyboard_rows = []
-    keyboard_rows.append([InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:today")])
-    if admin:
-        keyboard_rows.append([InlineKeyboardButton(text="🆕 ขายใหม่ / New sale", callback_data="new_sale")])
-        keyboard_rows.append([InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")])
-    else:
-        keyboard_rows.append([InlineKeyboardButton(text="🆕 ขายใหม่ / New sale", callback_data="new_sale")])
-    
-    await message.answer(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
+    report_text, keyboard = await render_report("today", admin)
+    await message.answer(report_text, reply_markup=keyboard)
 
 async def cmd_week(message: types.Message):
     """Handle /week command."""
     if not is_admin_user(message.from_user):
-        await message.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only")
+        await message.answer(ADMIN_ONLY_TEXT)
         return
     
-    start_date, end_date, count, total = get_week_report()
-    report_text = (
-        f"📆 รายงานรายสัปดาห์ / Weekly report\n"
-        f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-        f"ยอดขาย: {count} แก้ว / {count} cups\n"
-        f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
-    )
-    
-    # Add Details button
-    keyboard_rows = list(get_admin_keyboard().inline_keyboard)
-    keyboard_rows.insert(0, [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:week")])
-    
-    await message.answer(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
+    report_text, keyboard = await render_report("week", True)
+    await message.answer(report_text, reply_markup=keyboard)
 
 async def cmd_month(message: types.Message):
     """Handle /month command."""
     if not is_admin_user(message.from_user):
-        await message.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only")
+        await message.answer(ADMIN_ONLY_TEXT)
         return
     
-    start_date, end_date, count, total = get_month_report()
-    report_text = (
-        f"📅 รายงานประจำเดือนนี้ / This month report\n"
-        f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-        f"ยอดขาย: {count} แก้ว / {count} cups\n"
-        f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
-    )
-    
-    # Add Details button
-    keyboard_rows = list(get_admin_keyboard().inline_keyboard)
-    keyboard_rows.insert(0, [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:month")])
-    
-    await message.answer(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
+    report_text, keyboard = await render_report("month", True)
+    await message.answer(report_text, reply_markup=keyboard)
 
 async def cmd_alltime(message: types.Message):
     """Handle /alltime command."""
     if not is_admin_user(message.from_user):
-        await message.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only")
+        await message.answer(ADMIN_ONLY_TEXT)
         return
     
-    start_date, end_date, count, total = get_alltime_report()
-    report_text = (
-        f"🗂 รายงานทั้งหมด / All-time report\n"
-        f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-        f"ยอดขายรวม: {count} แก้ว / {count} cups\n"
-        f"ยอดรวมทั้งหมด: {total:,.2f} บาท / {total:,.2f} THB"
-    )
-    
-    # Add Details button
-    keyboard_rows = list(get_admin_keyboard().inline_keyboard)
-    keyboard_rows.insert(0, [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:alltime")])
-    
-    await message.answer(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
+    report_text, keyboard = await render_report("alltime", True)
+    await message.answer(report_text, reply_markup=keyboard)
 
 async def cmd_admin(message: types.Message):
     """Handle /admin command."""
     if not is_admin_user(message.from_user):
-        await message.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only")
+        await message.answer(ADMIN_ONLY_TEXT)
         return
     
     admin_text = (
@@ -500,372 +3243,590 @@ async def cmd_admin(message: types.Message):
     )
     await message.answer(admin_text, reply_markup=get_admin_keyboard())
 
-async def callback_handler(callback: types.CallbackQuery):
-    """Handle all inline keyboard callbacks."""
-    user_id = callback.from_user.id
-    data = callback.data
-    session = get_session(user_id)
-    
-    # ========== MAIN MENU ==========
-    if data == "new_sale":
-        clear_session(user_id)
-        await callback.message.edit_text(
-            "🆕 ขายใหม่ / New Sale\n\nขั้นที่ 1: เลือกหมวดหมู่\nStep 1: Choose category",
-            reply_markup=get_category_keyboard()
-        )
-        await callback.answer()
+async def cmd_cache(message: types.Message):
+    """Handle /cache command (report cache hit/miss counters)."""
+    if not is_admin_user(message.from_user):
+        await message.answer(ADMIN_ONLY_TEXT)
         return
-    
-    if data == "today_report":
-        today, count, total = get_today_report()
-        report_text = (
-            f"📊 รายงานวันนี้ / Today report\n"
-            f"วันที่: {today} / Date: {today}\n\n"
-            f"ยอดขาย: {count} แก้ว / {count} cups\n"
-            f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
-        )
-        admin = is_admin_user(callback.from_user)
-        
-        # Add Details button
-        keyboard_rows = []
-        keyboard_rows.append([InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:today")])
-        if admin:
-            keyboard_rows.append([InlineKeyboardButton(text="🆕 ขายใหม่ / New sale", callback_data="new_sale")])
-            keyboard_rows.append([InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")])
-        else:
-            keyboard_rows.append([InlineKeyboardButton(text="🆕 ขายใหม่ / New sale", callback_data="new_sale")])
-        
-        await callback.message.edit_text(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-        await callback.answer()
+
+    lookups = report_cache.hits + report_cache.misses
+    hit_rate = report_cache.hits / lookups * 100 if lookups else 0
+    await message.answer(
+        f"🗄 แคชรายงาน / Report cache\n\n"
+        f"Hits: {report_cache.hits}\n"
+        f"Misses: {report_cache.misses}\n"
+        f"Hit rate: {hit_rate:.1f}%\n"
+        f"Entries: {len(report_cache)}/{report_cache.max_entries}"
+    )
+
+async def cmd_stats(message: types.Message):
+    """Handle /stats command (handler latency by route over the rolling window)."""
+    if not is_admin_user(message.from_user):
+        await message.answer(ADMIN_ONLY_TEXT)
         return
-    
-    if data == "week_report":
-        if not is_admin_user(callback.from_user):
-            await callback.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only", show_alert=True)
-            return
-        
-        start_date, end_date, count, total = get_week_report()
-        report_text = (
-            f"📆 รายงานรายสัปดาห์ / Weekly report\n"
-            f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-            f"ยอดขาย: {count} แก้ว / {count} cups\n"
-            f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
+
+    recent = update_metrics.recent()
+    text = f"📊 สถิติ / Stats (last {METRICS_WINDOW_MINUTES} min)\n\n"
+    if not recent:
+        text += "ยังไม่มีข้อมูล / No updates yet\n"
+    for route, histogram in sorted(recent.items(), key=lambda item: -item[1].total):
+        text += (
+            f"{route}: {histogram.count}× "
+            f"p50 ≤{histogram.quantile(0.5) * 1000:g} / p95 ≤{histogram.quantile(0.95) * 1000:g} / "
+            f"p99 ≤{histogram.quantile(0.99) * 1000:g} ms, "
+            f"SQLite {histogram.db_total / histogram.count * 1000:.1f} ms avg\n"
         )
-        
-        # Add Details button
-        keyboard_rows = list(get_admin_keyboard().inline_keyboard)
-        keyboard_rows.insert(0, [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:week")])
-        
-        await callback.message.edit_text(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-        await callback.answer()
+    lookups = report_cache.hits + report_cache.misses
+    hit_rate = report_cache.hits / lookups * 100 if lookups else 0
+    text += (
+        f"\nSlow updates (≥{SLOW_UPDATE_MS:g} ms): {update_metrics.slow}\n"
+        f"Report cache: {report_cache.hits} hits / {report_cache.misses} misses ({hit_rate:.1f}%)"
+    )
+    await message.answer(text)
+
+async def cmd_backup(message: types.Message):
+    """Handle /backup command (snapshot the database now)."""
+    if not is_admin_user(message.from_user):
+        await message.answer(ADMIN_ONLY_TEXT)
         return
-    
-    if data == "month_report":
-        if not is_admin_user(callback.from_user):
-            await callback.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only", show_alert=True)
-            return
-        
-        start_date, end_date, count, total = get_month_report()
-        report_text = (
-            f"📅 รายงานประจำเดือนนี้ / This month report\n"
-            f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-            f"ยอดขาย: {count} แก้ว / {count} cups\n"
-            f"ยอดรวม: {total:,.2f} บาท / {total:,.2f} THB"
-        )
-        
-        # Add Details button
-        keyboard_rows = list(get_admin_keyboard().inline_keyboard)
-        keyboard_rows.insert(0, [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:month")])
-        
-        await callback.message.edit_text(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-        await callback.answer()
+
+    status = await message.answer("⏳ กำลังสำรองข้อมูล / Backing up...")
+    try:
+        path, stored, size, elapsed, archives = await sales_db.backup()
+    except (sqlite3.Error, OSError) as e:
+        await status.edit_text(f"❌ สำรองข้อมูลไม่สำเร็จ / Backup failed: {e}")
         return
-    
-    if data == "alltime_report":
-        if not is_admin_user(callback.from_user):
-            await callback.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only", show_alert=True)
-            return
-        
-        start_date, end_date, count, total = get_alltime_report()
-        report_text = (
-            f"🗂 รายงานทั้งหมด / All-time report\n"
-            f"ช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-            f"ยอดขายรวม: {count} แก้ว / {count} cups\n"
-            f"ยอดรวมทั้งหมด: {total:,.2f} บาท / {total:,.2f} THB"
+    await status.edit_text(
+        "💾 สำรองข้อมูลแล้ว / Backup done\n\n"
+        f"File: {os.path.basename(path)}\n"
+        f"Size: {stored / 1e6:.1f} MB (database {size / 1e6:.1f} MB)\n"
+        f"Time: {elapsed:.1f} s\n"
+        f"Archive files copied: {archives}\n"
+        f"Backups kept: {len(list_backups())}"
+    )
+
+# Telegram bots may upload documents up to 50 MB
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+async def cmd_export(message: types.Message):
+    """Handle /export [YYYY-MM-DD YYYY-MM-DD] [csv|jsonl] (sales as a gzipped document)."""
+    if not is_admin_user(message.from_user):
+        await message.answer(ADMIN_ONLY_TEXT)
+        return
+
+    words = (message.text or "").split()[1:]
+    fmt = "csv"
+    if words and words[-1].lower() in EXPORT_FORMATS:
+        fmt = words.pop().lower()
+    start_date = end_date = None
+    try:
+        if words:
+            start_date, end_date = parse_date_range(":".join(words))
+    except ValueError:
+        await message.answer(
+            "รูปแบบ / Usage: /export [YYYY-MM-DD YYYY-MM-DD] [csv|jsonl]\n"
+            "เช่น / e.g. /export 2025-01-01 2025-01-31 csv"
         )
-        
-        # Add Details button
-        keyboard_rows = list(get_admin_keyboard().inline_keyboard)
-        keyboard_rows.insert(0, [InlineKeyboardButton(text="📋 รายละเอียด / Details", callback_data="details:alltime")])
-        
-        await callback.message.edit_text(report_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-        await callback.answer()
         return
-    
-    if data == "admin_menu":
-        if not is_admin_user(callback.from_user):
-            await callback.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only", show_alert=True)
+
+    period = f"{start_date}_{end_date}" if start_date else "alltime"
+    handle, path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+    os.close(handle)
+    try:
+        rows = await sales_db.export_sales(path, start_date, end_date, fmt)
+        if os.path.getsize(path) > EXPORT_MAX_BYTES:
+            await message.answer(
+                "❌ ไฟล์ใหญ่เกินไป เลือกช่วงวันที่สั้นลง / File too large for Telegram, "
+                "choose a shorter date range (or use: python main.py export)"
+            )
             return
-        
-        admin_text = (
-            "👤 เมนูแอดมิน / Admin Menu\n\n"
-            "เลือกประเภทรายงาน:\n"
-            "Choose report type:"
+        await message.answer_document(
+            FSInputFile(path, filename=f"sales_{period}.{fmt}.gz"),
+            caption=f"📤 ส่งออกยอดขาย / Sales export: {rows} แถว / rows",
         )
-        await callback.message.edit_text(admin_text, reply_markup=get_admin_keyboard())
-        await callback.answer()
+    finally:
+        os.remove(path)
+
+async def cmd_range(message: types.Message):
+    """Handle /range [YYYY-MM-DD YYYY-MM-DD] (date picker without dates)."""
+    if not is_admin_user(message.from_user):
+        await message.answer(ADMIN_ONLY_TEXT)
         return
-    
-    if data == "back_to_main":
-        welcome_text = (
-            "🧋 ยินดีต้อนรับสู่ร้าน Cameron Pattaya!\n"
-            "🧋 Welcome to Cameron Pattaya!\n\n"
-            "ฉันจะช่วยคุณจัดการยอดขาย\n"
-            "I'll help you manage your sales.\n\n"
-            "เลือกตัวเลือกด้านล่าง:\n"
-            "Choose an option below:"
-        )
-        admin = is_admin_user(callback.from_user)
-        await callback.message.edit_text(
-            welcome_text,
-            reply_markup=get_main_keyboard(admin)
-        )
-        await callback.answer()
+
+    dates = (message.text or "").split()[1:]
+    if not dates:
+        text, keyboard = calendar_view(datetime.now().strftime("%Y-%m"), None)
+        await message.answer(text, reply_markup=keyboard)
         return
-    
-    if data == "cancel":
-        clear_session(user_id)
-        admin = is_admin_user(callback.from_user)
-        await callback.message.edit_text(
-            "❌ ยกเลิกแล้ว เลือกตัวเลือก:\n❌ Cancelled. Choose an option:",
-            reply_markup=get_main_keyboard(admin)
+    try:
+        start_date, end_date = parse_date_range(":".join(dates))
+    except ValueError:
+        await message.answer(
+            "รูปแบบ / Usage: /range YYYY-MM-DD YYYY-MM-DD\n"
+            "เช่น / e.g. /range 2025-01-01 2025-01-15"
         )
-        await callback.answer()
         return
-    
-    # ========== DETAILS REPORTS ==========
-    if data == "details:today":
-        today, _, _ = get_today_report()
-        start_datetime = f"{today} 00:00:00"
-        end_datetime = f"{today} 23:59:59"
-        details = get_sales_details(start_datetime, end_datetime)
-        
-        detail_text = f"📋 รายละเอียดยอดขายวันนี้ / Today sales details\nวันที่: {today} / Date: {today}\n\n"
-        
-        if details:
-            for drink_name, count, total in details:
-                detail_text += f"{drink_name}: {count} แก้ว / {count} cups – {total:,.2f} บาท / {total:,.2f} THB\n"
-        else:
-            detail_text += "ไม่มีข้อมูลการขาย / No sales data"
-        
-        admin = is_admin_user(callback.from_user)
-        keyboard_rows = []
-        keyboard_rows.append([InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="today_report")])
-        if admin:
-            keyboard_rows.append([InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")])
-        
-        await callback.message.edit_text(detail_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
+    report_text, keyboard = await render_range(start_date, end_date)
+    await message.answer(report_text, reply_markup=keyboard)
+
+# ========== MAIN MENU ==========
+async def cb_new_sale(callback: types.CallbackQuery, payload):
+    clear_session(callback.from_user.id)
+    await callback.message.edit_text(
+        "🆕 ขายใหม่ / New Sale\n\nขั้นที่ 1: เลือกหมวดหมู่\nStep 1: Choose category",
+        reply_markup=CATEGORY_KEYBOARD
+    )
+    await callback.answer()
+
+async def cb_report(kind: str, callback: types.CallbackQuery, payload):
+    admin = is_admin_user(callback.from_user)
+    report_text, keyboard = await render_report(kind, admin)
+    await callback.message.edit_text(report_text, reply_markup=keyboard)
+    await callback.answer()
+
+async def cb_admin_menu(callback: types.CallbackQuery, payload):
+    admin_text = (
+        "👤 เมนูแอดมิน / Admin Menu\n\n"
+        "เลือกประเภทรายงาน:\n"
+        "Choose report type:"
+    )
+    await callback.message.edit_text(admin_text, reply_markup=get_admin_keyboard())
+    await callback.answer()
+
+async def cb_back_to_main(callback: types.CallbackQuery, payload):
+    welcome_text = (
+        "🧋 ยินดีต้อนรับสู่ร้าน Cameron Pattaya!\n"
+        "🧋 Welcome to Cameron Pattaya!\n\n"
+        "ฉันจะช่วยคุณจัดการยอดขาย\n"
+        "I'll help you manage your sales.\n\n"
+        "เลือกตัวเลือกด้านล่าง:\n"
+        "Choose an option below:"
+    )
+    admin = is_admin_user(callback.from_user)
+    await callback.message.edit_text(
+        welcome_text,
+        reply_markup=get_main_keyboard(admin)
+    )
+    await callback.answer()
+
+async def cb_cancel(callback: types.CallbackQuery, payload):
+    clear_session(callback.from_user.id)
+    admin = is_admin_user(callback.from_user)
+    await callback.message.edit_text(
+        "❌ ยกเลิกแล้ว เลือกตัวเลือก:\n❌ Cancelled. Choose an option:",
+        reply_markup=get_main_keyboard(admin)
+    )
+    await callback.answer()
+
+# ========== DETAILS REPORTS ==========
+async def cb_details(kind: str, callback: types.CallbackQuery, payload):
+    admin = is_admin_user(callback.from_user)
+    detail_text, keyboard = await render_report(kind, admin, details=True)
+    await callback.message.edit_text(detail_text, reply_markup=keyboard)
+    await callback.answer()
+
+# ========== TREND REPORTS ==========
+async def cb_trend(kind: str, callback: types.CallbackQuery, payload):
+    report_text, keyboard = await render_trend(kind)
+    await callback.message.edit_text(report_text, reply_markup=keyboard)
+    await callback.answer()
+
+# ========== DATE RANGE ==========
+async def cb_date_range(callback: types.CallbackQuery, payload):
+    text, keyboard = calendar_view(datetime.now().strftime("%Y-%m"), None)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+async def cb_calendar(callback: types.CallbackQuery, view):
+    month, start = view
+    text, keyboard = calendar_view(month, start)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+async def cb_range(callback: types.CallbackQuery, dates):
+    report_text, keyboard = await render_range(*dates)
+    await callback.message.edit_text(report_text, reply_markup=keyboard)
+    await callback.answer()
+
+async def cb_range_details(callback: types.CallbackQuery, dates):
+    detail_text, keyboard = await render_range(*dates, details=True)
+    await callback.message.edit_text(detail_text, reply_markup=keyboard)
+    await callback.answer()
+
+async def cb_noop(callback: types.CallbackQuery, payload):
+    """Calendar labels and blanks."""
+    await callback.answer()
+
+# ========== CATEGORY SELECTION ==========
+async def cb_category(callback: types.CallbackQuery, idx: int):
+    if not 0 <= idx < len(MENU_INDEX):
         await callback.answer()
         return
-    
-    if data == "details:week":
-        if not is_admin_user(callback.from_user):
-            await callback.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only", show_alert=True)
-            return
-        
-        start_date, end_date, _, _ = get_week_report()
-        start_datetime = f"{start_date} 00:00:00"
-        end_datetime = f"{end_date} 23:59:59"
-        details = get_sales_details(start_datetime, end_datetime)
-        
-        detail_text = f"📆 รายละเอียดรายสัปดาห์ / Weekly sales details\nช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-        
-        if details:
-            for drink_name, count, total in details:
-                detail_text += f"{drink_name}: {count} แก้ว / {count} cups – {total:,.2f} บาท / {total:,.2f} THB\n"
-        else:
-            detail_text += "ไม่มีข้อมูลการขาย / No sales data"
-        
-        keyboard_rows = [
-            [InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="week_report")],
-            [InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")]
-        ]
-        
-        await callback.message.edit_text(detail_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-        await callback.answer()
+    user_id = callback.from_user.id
+    session = get_session(user_id)
+    session.category = idx
+    session.drink = None  # a drink index only means something within its category
+    save_session(user_id)
+    category = MENU_INDEX[idx]
+    await callback.message.edit_text(category.drink_step_text, reply_markup=category.drink_keyboard)
+    await callback.answer()
+
+# ========== DRINK SELECTION ==========
+async def cb_drink(callback: types.CallbackQuery, drink_idx: int):
+    user_id = callback.from_user.id
+    session = get_session(user_id)
+    category_idx = session.category
+    if category_idx is None or not 0 <= drink_idx < len(MENU_INDEX[category_idx].drinks):
+        await cb_new_sale(callback, None)  # the session is gone, start over
         return
-    
-    if data == "details:month":
-        if not is_admin_user(callback.from_user):
-            await callback.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only", show_alert=True)
-            return
-        
-        start_date, end_date, _, _ = get_month_report()
-        start_datetime = f"{start_date} 00:00:00"
-        end_datetime = f"{end_date} 23:59:59"
-        details = get_sales_details(start_datetime, end_datetime)
-        
-        detail_text = f"📅 รายละเอียดประจำเดือน / Monthly sales details\nช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-        
-        if details:
-            for drink_name, count, total in details:
-                detail_text += f"{drink_name}: {count} แก้ว / {count} cups – {total:,.2f} บาท / {total:,.2f} THB\n"
-        else:
-            detail_text += "ไม่มีข้อมูลการขาย / No sales data"
-        
-        keyboard_rows = [
-            [InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="month_report")],
-            [InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")]
-        ]
-        
-        await callback.message.edit_text(detail_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-        await callback.answer()
+    session.drink = drink_idx
+    save_session(user_id)
+    drink = MENU_INDEX[category_idx].drinks[drink_idx]
+    await callback.message.edit_text(drink.size_step_text, reply_markup=drink.size_keyboard)
+    await callback.answer()
+
+# ========== SIZE SELECTION ==========
+async def cb_size(callback: types.CallbackQuery, size_idx: int):
+    user_id = callback.from_user.id
+    session = get_session(user_id)
+    category_idx = session.category
+    drink_idx = session.drink
+    drinks = MENU_INDEX[category_idx].drinks if category_idx is not None and 0 <= category_idx < len(MENU_INDEX) else ()
+    if drink_idx is None or not 0 <= drink_idx < len(drinks) or not 0 <= size_idx < len(drinks[drink_idx].sizes):
+        await cb_back_to_category(callback, None)  # stale or forged tap; the cart is kept
         return
-    
-    if data == "details:alltime":
-        if not is_admin_user(callback.from_user):
-            await callback.answer("คำสั่งนี้สำหรับแอดมินเท่านั้น / This command is for admins only", show_alert=True)
-            return
-        
-        start_date, end_date, _, _ = get_alltime_report()
-        
-        if start_date == "N/A":
-            detail_text = "ไม่มีข้อมูลการขาย / No sales data available"
-            keyboard_rows = [
-                [InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="alltime_report")],
-                [InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")]
-            ]
-            await callback.message.edit_text(detail_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-            await callback.answer()
-            return
-        
-        start_datetime = f"{start_date} 00:00:00"
-        end_datetime = f"{end_date} 23:59:59"
-        details = get_sales_details(start_datetime, end_datetime)
-        
-        detail_text = f"🗂 รายละเอียดทั้งหมด / All-time sales details\nช่วงวันที่: {start_date} ถึง {end_date} / Date range: {start_date} to {end_date}\n\n"
-        
-        if details:
-            for drink_name, count, total in details:
-                detail_text += f"{drink_name}: {count} แก้ว / {count} cups – {total:,.2f} บาท / {total:,.2f} THB\n"
-        else:
-            detail_text += "ไม่มีข้อมูลการขาย / No sales data"
-        
-        keyboard_rows = [
-            [InlineKeyboardButton(text="🔙 กลับ / Back", callback_data="alltime_report")],
-            [InlineKeyboardButton(text="👤 แอดมิน / Admin", callback_data="admin_menu")]
-        ]
-        
-        await callback.message.edit_text(detail_text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_rows))
-        await callback.answer()
+    add_to_cart(session, (category_idx, drink_idx, size_idx))
+    save_session(user_id)
+    await show_cart(callback, session)
+
+# ========== QUICK SALE ==========
+async def cb_quick_sale(callback: types.CallbackQuery, pick):
+    """Start a new order with a best seller from the main menu, straight to the cart."""
+    user_id = callback.from_user.id
+    clear_session(user_id)
+    session = get_session(user_id)
+    add_to_cart(session, pick)
+    save_session(user_id)
+    await show_cart(callback, session)
+
+# ========== CART ==========
+async def show_cart(callback: types.CallbackQuery, session: Session):
+    if not session.items:
+        await cb_new_sale(callback, None)
         return
-    
-    # ========== CATEGORY SELECTION ==========
-    if data.startswith("cat:"):
-        idx = int(data.split(":", 1)[1])
-        categories = list(MENU.keys())
-        category = categories[idx]
-        session['category'] = category
-        await callback.message.edit_text(
-            f"🆕 ขายใหม่ / New Sale\n\nหมวดหมู่ / Category: {category}\n\nขั้นที่ 2: เลือกเครื่องดื่ม\nStep 2: Choose drink:",
-            reply_markup=get_drink_keyboard(category)
-        )
-        await callback.answer()
+    await callback.message.edit_text(cart_view(session), reply_markup=CART_KEYBOARD)
+    await callback.answer()
+
+async def cb_back_to_cart(callback: types.CallbackQuery, payload):
+    await show_cart(callback, get_session(callback.from_user.id))
+
+async def cb_add_drink(callback: types.CallbackQuery, payload):
+    if not get_session(callback.from_user.id).items:
+        await cb_new_sale(callback, None)
         return
-    
-    # ========== DRINK SELECTION ==========
-    if data.startswith("drink:"):
-        drink_idx = int(data.split(":", 1)[1])
-        category = session.get('category')
-        drinks = list(MENU[category].keys())
-        drink = drinks[drink_idx]
-        session['drink'] = drink
-        await callback.message.edit_text(
-            f"🆕 ขายใหม่ / New Sale\n\nหมวดหมู่ / Category: {category}\nเครื่องดื่ม / Drink: {drink}\n\nขั้นที่ 3: เลือกขนาด\nStep 3: Choose size:",
-            reply_markup=get_size_keyboard(category, drink)
-        )
-        await callback.answer()
+    await callback.message.edit_text(
+        "🛒 เพิ่มรายการ / Add item\n\nขั้นที่ 1: เลือกหมวดหมู่\nStep 1: Choose category:",
+        reply_markup=CART_CATEGORY_KEYBOARD
+    )
+    await callback.answer()
+
+async def cb_add_topping(callback: types.CallbackQuery, payload):
+    session = get_session(callback.from_user.id)
+    if not session.items or TOPPING_KEYBOARD is None:
+        await show_cart(callback, session)
         return
-    
-    # ========== SIZE SELECTION ==========
-    if data.startswith("size:"):
-        size_idx = int(data.split(":", 1)[1])
-        category = session.get('category')
-        drink = session.get('drink')
-
-        sizes = list(MENU[category][drink].keys())
-        size = sizes[size_idx]
-
-        session['size'] = size
-        price = MENU[category][drink][size]
-        session['price'] = price
-
-        await callback.message.edit_text(
-            f"🆕 ขายใหม่ / New Sale\n\n"
-            f"หมวดหมู่ / Category: {category}\n"
-            f"เครื่องดื่ม / Drink: {drink}\n"
-            f"ขนาด / Size: {size}\n"
-            f"ราคา / Price: {price} บาท / THB\n\n"
-            f"ขั้นที่ 4: เลือกวิธีชำระเงิน\n"
-            f"Step 4: Choose payment type:",
-            reply_markup=get_payment_keyboard()
-        )
+    _, drink, size, _ = _pick(session.items[-1][0])
+    await callback.message.edit_text(
+        f"➕ ท็อปปิ้ง / Topping\n\nสำหรับ / For: {drink.name} ({size})\n\n"
+        f"เลือกท็อปปิ้ง\nChoose topping:",
+        reply_markup=TOPPING_KEYBOARD
+    )
+    await callback.answer()
+
+async def cb_topping(callback: types.CallbackQuery, idx: int):
+    user_id = callback.from_user.id
+    session = get_session(user_id)
+    if TOPPINGS_INDEX is None or not 0 <= idx < len(MENU_INDEX[TOPPINGS_INDEX].drinks):
         await callback.answer()
         return
-    
-    # ========== PAYMENT SELECTION ==========
-    if data.startswith("pay:"):
-        payment_type = data.split(":", 1)[1]
-
-        category = session.get('category')
-        drink = session.get('drink')
-        size = session.get('size')
-        price = session.get('price')
-
-        # Save to database
-        save_sale(drink, category, size, price, payment_type)
-
-        # Clear session
-        clear_session(user_id)
-
-        # Определяем, админ ли пользователь
-        admin = is_admin_user(callback.from_user)
-
-        # Send confirmation
-        await callback.message.edit_text(
-            f"✅ บันทึกการขายแล้ว!\n✅ Sale saved!\n\n"
-            f"เครื่องดื่ม / Drink: {drink}\n"
-            f"ขนาด / Size: {size}\n"
-            f"ยอดเงิน / Amount: {price} บาท / THB\n"
-            f"ชำระโดย / Payment: {payment_type}",
-            reply_markup=get_main_keyboard(admin)
-        )
+    add_to_cart(session, (TOPPINGS_INDEX, idx, 0))
+    save_session(user_id)
+    await show_cart(callback, session)
+
+async def cb_remove_last(callback: types.CallbackQuery, payload):
+    user_id = callback.from_user.id
+    session = get_session(user_id)
+    remove_last(session)
+    save_session(user_id)
+    await show_cart(callback, session)
+
+# ========== PAYMENT SELECTION ==========
+async def cb_pay(callback: types.CallbackQuery, payment_type: str):
+    user_id = callback.from_user.id
+    session = get_session(user_id)
+    if callback.id in recent_sales or (not session.items and sale_message_key(callback) in recent_sales):
+        # Redelivered callback, or a second tap on the "pay" button of an
+        # order that was just saved
         await callback.answer("✅ บันทึกแล้ว / Saved!")
         return
-    
-    # ========== NAVIGATION ==========
-    if data == "back_to_category":
-        await callback.message.edit_text(
-            "🆕 ขายใหม่ / New Sale\n\nขั้นที่ 1: เลือกหมวดหมู่\nStep 1: Choose category:",
-            reply_markup=get_category_keyboard()
-        )
+    if not session.items:
+        await cb_new_sale(callback, None)
+        return
+
+    # Save the whole order in one transaction
+    lines = cart_lines(session)
+    await sales_db.save_order(lines, payment_type, order_key=session.sale_key)
+    recent_sales.add(callback.id, sale_message_key(callback))
+
+    # Clear session
+    clear_session(user_id)
+
+    # Определяем, админ ли пользователь
+    admin = is_admin_user(callback.from_user)
+
+    # Send confirmation
+    await callback.message.edit_text(
+        f"✅ บันทึกการขายแล้ว!\n✅ Sale saved!\n\n"
+        f"{format_cart(lines)}\n"
+        f"ชำระโดย / Payment: {payment_type}",
+        reply_markup=get_main_keyboard(admin)
+    )
+    await callback.answer("✅ บันทึกแล้ว / Saved!")
+
+# ========== INLINE SALES ==========
+async def inline_search(inline_query: types.InlineQuery):
+    """Answer "@bot <letters>" with matching drinks and sizes."""
+    await inline_query.answer(search_menu(inline_query.query), cache_time=INLINE_CACHE_SECONDS,
+                              is_personal=True)
+
+async def cb_inline_pay(callback: types.CallbackQuery, sale):
+    """Record the sale of a drink posted from inline search (one message, one sale)."""
+    if callback.inline_message_id is None:
         await callback.answer()
         return
-    
-    if data == "back_to_drink":
-        category = session.get('category')
-        await callback.message.edit_text(
-            f"🆕 ขายใหม่ / New Sale\n\nหมวดหมู่ / Category: {category}\n\nขั้นที่ 2: เลือกเครื่องดื่ม\nStep 2: Choose drink:",
-            reply_markup=get_drink_keyboard(category)
-        )
+    if callback.id in recent_sales or sale_message_key(callback) in recent_sales:
+        await callback.answer("✅ บันทึกแล้ว / Saved!")
+        return
+    category_idx, drink_idx, size_idx, payment_type = sale
+    category = MENU_INDEX[category_idx]
+    drink = category.drinks[drink_idx]
+    size, price = drink.sizes[size_idx], drink.prices[size_idx]
+
+    # The inline message id doubles as the order key, so the message sells once
+    await sales_db.save_order([(1, drink.name, category.name, size, price)], payment_type,
+                              order_key=f"inline:{callback.inline_message_id}")
+    recent_sales.add(callback.id, sale_message_key(callback))
+    await callback.bot.edit_message_text(
+        f"✅ บันทึกการขายแล้ว!\n✅ Sale saved!\n\n"
+        f"เครื่องดื่ม / Drink: {drink.name}\n"
+        f"ขนาด / Size: {size}\n"
+        f"ยอดเงิน / Amount: {price} บาท / THB\n"
+        f"ชำระโดย / Payment: {payment_type}",
+        inline_message_id=callback.inline_message_id,
+    )
+    await callback.answer("✅ บันทึกแล้ว / Saved!")
+
+# ========== NAVIGATION ==========
+async def cb_back_to_category(callback: types.CallbackQuery, payload):
+    if get_session(callback.from_user.id).items:
+        await cb_add_drink(callback, None)
+        return
+    await callback.message.edit_text(
+        "🆕 ขายใหม่ / New Sale\n\nขั้นที่ 1: เลือกหมวดหมู่\nStep 1: Choose category:",
+        reply_markup=CATEGORY_KEYBOARD
+    )
+    await callback.answer()
+
+async def cb_back_to_drink(callback: types.CallbackQuery, payload):
+    category_idx = get_session(callback.from_user.id).category
+    if category_idx is None:
+        await cb_back_to_category(callback, None)
+        return
+    category = MENU_INDEX[category_idx]
+    await callback.message.edit_text(category.drink_step_text, reply_markup=category.drink_keyboard)
+    await callback.answer()
+
+# ========== ROUTING TABLE ==========
+class Route(NamedTuple):
+    """A callback route: its handler, whether it is admin-only and how to parse its payload."""
+    handler: Callable[[types.CallbackQuery, Any], Awaitable[None]]
+    admin_only: bool = False
+    parse: Optional[Callable[[str], Any]] = None
+
+# Exact callback_data strings, looked up in one dict probe.
+CALLBACK_ROUTES = {
+    "new_sale": Route(cb_new_sale),
+    "today_report": Route(partial(cb_report, "today")),
+    "week_report": Route(partial(cb_report, "week"), admin_only=True),
+    "month_report": Route(partial(cb_report, "month"), admin_only=True),
+    "alltime_report": Route(partial(cb_report, "alltime"), admin_only=True),
+    "admin_menu": Route(cb_admin_menu, admin_only=True),
+    "back_to_main": Route(cb_back_to_main),
+    "cancel": Route(cb_cancel),
+    "details:today": Route(partial(cb_details, "today")),
+    "details:week": Route(partial(cb_details, "week"), admin_only=True),
+    "details:month": Route(partial(cb_details, "month"), admin_only=True),
+    "details:alltime": Route(partial(cb_details, "alltime"), admin_only=True),
+    "back_to_category": Route(cb_back_to_category),
+    "back_to_drink": Route(cb_back_to_drink),
+    "date_range": Route(cb_date_range, admin_only=True),
+    "hourly_report": Route(partial(cb_trend, "hourly"), admin_only=True),
+    "weekday_report": Route(partial(cb_trend, "weekday"), admin_only=True),
+    "noop": Route(cb_noop),
+    "back_to_cart": Route(cb_back_to_cart),
+    "add_drink": Route(cb_add_drink),
+    "add_topping": Route(cb_add_topping),
+    "remove_last": Route(cb_remove_last),
+}
+
+# "prefix:payload" callbacks; the payload is parsed once into its typed value.
+PREFIX_ROUTES = {
+    "cat": Route(cb_category, parse=int),
+    "drink": Route(cb_drink, parse=int),
+    "size": Route(cb_size, parse=int),
+    "top": Route(cb_topping, parse=int),
+    "quick": Route(cb_quick_sale, parse=parse_menu_pick),
+    "ipay": Route(cb_inline_pay, parse=parse_inline_sale),
+    "pay": Route(cb_pay, parse=parse_payment),
+    "cal": Route(cb_calendar, admin_only=True, parse=parse_calendar),
+    "range": Route(cb_range, admin_only=True, parse=parse_date_range),
+    "rdet": Route(cb_range_details, admin_only=True, parse=parse_date_range),
+}
+
+def resolve_callback(data: str):
+    """Map callback_data to (route, payload); (None, None) if nothing matches."""
+    route = CALLBACK_ROUTES.get(data)
+    if route is not None:
+        return route, None
+    prefix, _, raw = data.partition(":")
+    route = PREFIX_ROUTES.get(prefix)
+    if route is None:
+        return None, None
+    try:
+        return route, route.parse(raw)
+    except ValueError:
+        return None, None
+
+async def callback_handler(callback: types.CallbackQuery):
+    """Handle all inline keyboard callbacks."""
+    route, payload = resolve_callback(callback.data or "")
+    if route is None:
         await callback.answer()
         return
+    if route.admin_only and not is_admin_user(callback.from_user):
+        await callback.answer(ADMIN_ONLY_TEXT, show_alert=True)
+        return
+    await route.handler(callback, payload)
+
+# /command -> handler
+COMMANDS = {
+    "start": cmd_start,
+    "report": cmd_report,
+    "week": cmd_week,
+    "month": cmd_month,
+    "alltime": cmd_alltime,
+    "admin": cmd_admin,
+    "cache": cmd_cache,
+    "stats": cmd_stats,
+    "range": cmd_range,
+    "export": cmd_export,
+    "backup": cmd_backup,
+}
+
+# ============================================================================
+# WEBHOOK SERVER
+# ============================================================================
+# Telegram POSTs each update to WEBHOOK_URL + WEBHOOK_PATH with the secret
+# token in a header; requests without it are rejected.
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # public https base URL, e.g. https://bot.example.com
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_DRAIN_SECONDS = float(os.getenv('WEBHOOK_DRAIN_SECONDS', '10'))
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Webhook handler that lets in-flight updates finish before shutdown."""
+
+    async def close(self):
+        tasks = self._background_feed_update_tasks
+        if tasks:
+            print(f"⏳ Waiting for {len(tasks)} update(s) to finish...")
+            await asyncio.wait(set(tasks), timeout=WEBHOOK_DRAIN_SECONDS)
+        await super().close()
+
+async def run_webhook(bot: Bot, dp: Dispatcher, host: str, port: int):
+    """Serve updates over HTTP until SIGINT/SIGTERM, then drain and stop."""
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    app = web.Application()
+    DrainingRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"🌐 Webhook server listening on http://{host}:{port}{WEBHOOK_PATH}")
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=secret,
+                              allowed_updates=dp.resolve_used_update_types())
+        print(f"🔗 Webhook registered at {WEBHOOK_URL}")
+    else:
+        print("⚠️ WEBHOOK_URL not set: Telegram was not told about this server")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stop.wait()
+    finally:
+        # Stops accepting requests, then the handler drains in-flight updates
+        await runner.cleanup()
 
 # ============================================================================
 # MAIN FUNCTION
 # ============================================================================
+async def run_archiver(repository: SalesRepository):
+    """Move closed months to archive files now and every ARCHIVE_CHECK_HOURS."""
+    while True:
+        try:
+            await repository.archive(ARCHIVE_KEEP_MONTHS)
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ Archiving failed: {e}")
+        await asyncio.sleep(ARCHIVE_CHECK_HOURS * 3600)
+
+async def run_backups(repository: SalesRepository):
+    """Back up every BACKUP_INTERVAL_HOURS, counting from the newest backup (so restarts do not add any)."""
+    interval = BACKUP_INTERVAL_HOURS * 3600
+    while True:
+        backups = list_backups()
+        newest = os.path.getmtime(backups[-1]) if backups else 0
+        await asyncio.sleep(max(0, newest + interval - time.time()))
+        try:
+            await repository.backup()
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ Backup failed: {e}")
+            await asyncio.sleep(BACKUP_RETRY_SECONDS)
+
+def build_dispatcher() -> Dispatcher:
+    """Create the dispatcher with middlewares and all handlers registered."""
+    dp = Dispatcher()
+    # 🔐 Глобальный доступ только для разрешённых пользователей
+    dp.update.middleware(AccessMiddleware())
+    dp.update.outer_middleware(UserOrderingMiddleware())
+    dp.update.outer_middleware(MetricsMiddleware())
+    
+    # Register handlers
+    for command, handler in COMMANDS.items():
+        dp.message.register(handler, Command(command))
+    dp.callback_query.register(callback_handler)
+    dp.inline_query.register(inline_search)
+    return dp
 
-async def main():
+async def main(mode: str = "polling", host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
     """Main function to run the bot."""
     # Get bot token from environment variable
     token = os.getenv('TELEGRAM_TOKEN')
@@ -881,30 +3842,148 @@ async def main():
     
     # Initialize database
     init_database()
+    replay_sale_journal()
     
     # Create bot and dispatcher
     bot = Bot(token=token)
-    dp = Dispatcher()
-    # 🔐 Глобальный доступ только для разрешённых пользователей
-    dp.update.middleware(AccessMiddleware())
-    
-    # Register handlers
-    dp.message.register(cmd_start, Command("start"))
-    dp.message.register(cmd_report, Command("report"))
-    dp.message.register(cmd_week, Command("week"))
-    dp.message.register(cmd_month, Command("month"))
-    dp.message.register(cmd_alltime, Command("alltime"))
-    dp.message.register(cmd_admin, Command("admin"))
-    dp.callback_query.register(callback_handler)
+    bot.session.middleware(OutboundScheduler())
+    dp = build_dispatcher()
     
     print("🚀 Bot started! Press Ctrl+C to stop.")
     print("📱 Go to your Telegram bot and type /start")
     
-    # Start polling
+    if SESSION_PERSIST:
+        sessions.load(load_sessions(sessions.ttl))
+        sessions.persist = sales_db.persist_session
+        print(f"💾 Persistent sessions enabled ({len(sessions)} restored)")
+
+    if SALES_WRITE_BEHIND:
+        sales_db.write_behind = SaleBuffer(sales_db)
+        sales_db.write_behind.start()
+        print("📝 Write-behind sale buffer enabled")
+
+    metrics_runner = await start_metrics_server() if METRICS_PORT else None
+    archiver = asyncio.create_task(run_archiver(sales_db)) if ARCHIVE_KEEP_MONTHS else None
+    backups = asyncio.create_task(run_backups(sales_db)) if BACKUP_INTERVAL_HOURS else None
+
     try:
-        await dp.start_polling(bot)
+        if mode == "webhook":
+            await run_webhook(bot, dp, host, port)
+        else:
+            # Telegram refuses getUpdates while a webhook is set
+            await bot.delete_webhook()
+            # Every update runs as its own task; UserOrderingMiddleware keeps
+            # each user's updates in order.
+            await dp.start_polling(bot, handle_as_tasks=True)
     finally:
+        if archiver is not None:
+            archiver.cancel()
+        if backups is not None:
+            backups.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if sales_db.write_behind is not None:
+            await sales_db.write_behind.close()
         await bot.session.close()
+        sales_db.close()
+
+def run_export(args):
+    """`python main.py export`: write sales to a file without starting the bot."""
+    start_date = end_date = None
+    if args.start or args.end:
+        start_date, end_date = parse_date_range(":".join(d for d in (args.start, args.end) if d))
+    output = args.output or f"sales_{f'{start_date}_{end_date}' if start_date else 'alltime'}.{args.format}.gz"
+    init_database()
+    started = time.perf_counter()
+    rows = export_sales(output, start_date, end_date, args.format)
+    elapsed = time.perf_counter() - started
+    print(f"📤 Exported {rows} sales to {output} in {elapsed:.1f}s")
+    db_pool.close()
+
+def run_import(args):
+    """`python main.py import`: load historical sales from a POS CSV."""
+    init_database()
+    started = time.perf_counter()
+    try:
+        imported, rejects = import_sales(args.file, args.payment, not args.any_price, args.rejects, args.force)
+    except ValueError as e:
+        print(f"❌ Import failed: {e}")
+        raise SystemExit(1)
+    finally:
+        db_pool.close()
+    elapsed = time.perf_counter() - started
+    rejected = sum(rejects.values())
+    print(f"📥 Imported {imported} sales from {args.file} in {elapsed:.1f}s "
+          f"({imported / elapsed if elapsed else 0:,.0f} rows/s), rejected {rejected}")
+    for reason, count in rejects.most_common():
+        print(f"   - {reason}: {count}")
+    if rejected and args.rejects:
+        print(f"   Rejected rows written to {args.rejects}")
+
+def run_archive(args):
+    """`python main.py archive`: archive closed months now, compact the live file and list the archives."""
+    init_database()
+    try:
+        archive_closed_months(args.keep)
+        compact_database()
+        partitions = list_partitions()
+    finally:
+        db_pool.close()
+    print(f"🗄 {len(partitions)} archived months in {archive_dir()}")
+    for month, file, first_ts, last_ts, count, amount in partitions:
+        print(f"   {month}  {count:>8} sales  {amount / 100:>12,.0f} ฿  {file}")
+
+def run_backup(args):
+    """`python main.py backup`: take a snapshot now (safe while the bot is running)."""
+    init_database()
+    try:
+        backup_database(args.keep)
+    finally:
+        db_pool.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cameron Pattaya sales bot")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling",
+                        help="how to receive updates from Telegram (default: polling)")
+    parser.add_argument("--host", default=WEBHOOK_HOST, help="webhook server address")
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT, help="webhook server port")
+    commands = parser.add_subparsers(dest="command")
+
+    export = commands.add_parser("export", help="export sales to CSV or JSONL")
+    export.add_argument("--from", dest="start", metavar="YYYY-MM-DD", help="first day (default: all)")
+    export.add_argument("--to", dest="end", metavar="YYYY-MM-DD", help="last day (default: same as --from)")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export.add_argument("-o", "--output", help="file to write, gzipped if it ends in .gz "
+                                               "(default: sales_<range>.<format>.gz)")
+
+    load = commands.add_parser("import", help="load historical sales from a POS CSV")
+    load.add_argument("file", help="CSV with datetime, drink_name, size, price and optional "
+                                   "category, payment_type columns (may be .gz)")
+    load.add_argument("--payment", choices=PAYMENT_TYPES, default="cash",
+                      help="payment type for rows without one (default: cash)")
+    load.add_argument("--any-price", action="store_true", help="accept prices that differ from the menu")
+    load.add_argument("--rejects", metavar="FILE", help="write rejected rows and the reason to this CSV")
+    load.add_argument("--force", action="store_true", help="import a file again even if it was loaded before")
+
+    archive = commands.add_parser("archive", help="move closed months to per-month archive files")
+    archive.add_argument("--keep", type=int, default=ARCHIVE_KEEP_MONTHS or 2,
+                         help="live months to keep, including the current one "
+                              f"(default: {ARCHIVE_KEEP_MONTHS or 2})")
+
+    backup = commands.add_parser("backup", help="snapshot the database into the backup directory")
+    backup.add_argument("--keep", type=int, default=BACKUP_KEEP,
+                        help=f"snapshots to keep, newest first (default: {BACKUP_KEEP})")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    if args.command == "export":
+        run_export(args)
+    elif args.command == "import":
+        run_import(args)
+    elif args.command == "archive":
+        run_archive(args)
+    elif args.command == "backup":
+        run_backup(args)
+    else:
+        asyncio.run(main(args.mode, args.host, args.port))
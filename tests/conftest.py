@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database in a temporary directory; yields the calling thread's connection."""
+    monkeypatch.setattr(main, "DB_PATH", str(tmp_path / "sales.db"))
+    monkeypatch.setattr(main, "report_cache", main.ReportCache())
+    main.init_database()
+    yield main.db_pool.connection()
+    main.db_pool.close()
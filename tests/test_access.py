@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sys
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+
+
+class RecordingSession(BaseSession):
+    """Record outgoing requests instead of calling Telegram."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def message_update(update_id, username, text="/start"):
+    return Update.model_validate({"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": 500 + update_id, "type": "private"},
+        "from": {"id": 500 + update_id, "is_bot": False, "first_name": "User", "username": username}}})
+
+
+def callback_update(update_id, username, data="new_sale"):
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "data": data, "chat_instance": "1",
+        "from": {"id": 500 + update_id, "is_bot": False, "first_name": "User", "username": username}}})
+
+
+def replay(updates):
+    """Feed updates through a dispatcher wired like the bot's; returns (handled, sent)."""
+    handled = []
+
+    async def handler(event):
+        handled.append(event.from_user.username)
+
+    dp = Dispatcher()
+    dp.update.middleware(main.AccessMiddleware())
+    dp.message.register(handler)
+    dp.callback_query.register(handler)
+    session = RecordingSession()
+    bot = Bot("1:offline", session=session)
+
+    async def run():
+        for update in updates:
+            await dp.feed_update(bot, update)
+
+    asyncio.run(run())
+    return handled, session.calls
+
+
+def test_unlisted_user_is_rejected():
+    handled, sent = replay([message_update(1, "stranger"), callback_update(2, "stranger")])
+    assert handled == []
+    assert [type(method).__name__ for method in sent] == ["SendMessage", "AnswerCallbackQuery"]
+    assert all(method.text == "❌ Access denied" for method in sent)
+
+
+def test_allowed_user_is_let_through():
+    handled, sent = replay([message_update(1, "dkokhel"), callback_update(2, "NangSihalath")])
+    assert handled == ["dkokhel", "NangSihalath"]
+    assert sent == []
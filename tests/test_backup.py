@@ -0,0 +1,14 @@
+import sqlite3
+
+import main
+
+
+def test_backup_pauses_between_steps(db, tmp_path, monkeypatch):
+    pauses = []
+    monkeypatch.setattr(main, "BACKUP_STEP_PAGES", 1)
+    monkeypatch.setattr(main.time, "sleep", pauses.append)
+    pages = main._copy_database(main.DB_PATH, str(tmp_path / "copy.db"))
+    assert pages > 1
+    assert pauses == [main.BACKUP_STEP_SLEEP] * (pages - 1)
+    with sqlite3.connect(tmp_path / "copy.db") as copy:
+        assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
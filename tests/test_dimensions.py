@@ -0,0 +1,20 @@
+import pytest
+
+import main
+
+
+def test_rolled_back_sale_leaves_no_new_ids_behind(db):
+    new_drink = main.make_sale_row("ชาใหม่ / New Tea", "เมนูใหม่ / New", "Jumbo", 70, "wallet")
+    bad = main.make_sale_row("อเมริกาโน่ / Americano", "กาแฟ / Coffee", "M", None, "cash")
+    with pytest.raises(TypeError):
+        main.record_sales([new_drink, bad])
+
+    assert ("เมนูใหม่ / New", "ชาใหม่ / New Tea") not in main.dimensions.drinks
+    assert "เมนูใหม่ / New" not in main.dimensions.categories
+    assert "Jumbo" not in main.dimensions.sizes and "wallet" not in main.dimensions.payment_types
+    assert "ชาใหม่ / New Tea" not in main.dimensions.drink_names.values()
+    assert db.execute("SELECT COUNT(*) FROM drinks WHERE name = 'ชาใหม่ / New Tea'").fetchone()[0] == 0
+
+    main.record_sales([new_drink])
+    drink_id = main.dimensions.drinks[("เมนูใหม่ / New", "ชาใหม่ / New Tea")]
+    assert db.execute("SELECT drink_id FROM sales").fetchall() == [(drink_id,)]
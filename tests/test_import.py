@@ -0,0 +1,33 @@
+import sqlite3
+
+import pytest
+
+import main
+
+
+def write_csv(path):
+    path.write_text("datetime,drink_name,size,price\n2024-01-05T10:00:00,Thai Tea,Iced,30\n", encoding="utf-8")
+    return str(path)
+
+
+def test_import_refuses_while_database_is_open_elsewhere(db, tmp_path):
+    other = sqlite3.connect(main.DB_PATH)  # stands in for the running bot
+    other.execute("SELECT COUNT(*) FROM sales").fetchone()
+    try:
+        with pytest.raises(ValueError, match="in use"):
+            main.import_sales(write_csv(tmp_path / "old.csv"))
+        # The bot's connection can still write once the import has given up
+        other.execute("INSERT INTO meta (key, value) VALUES ('probe', '1')")
+        other.commit()
+    finally:
+        other.close()
+
+
+def test_import_releases_the_database_afterwards(db, tmp_path):
+    imported, rejects = main.import_sales(write_csv(tmp_path / "old.csv"))
+    assert (imported, sum(rejects.values())) == (1, 0)
+    other = sqlite3.connect(main.DB_PATH, timeout=0)
+    try:
+        assert other.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 1
+    finally:
+        other.close()
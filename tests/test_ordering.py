@@ -0,0 +1,65 @@
+import asyncio
+import random
+import re
+import time
+
+from aiogram import Bot
+
+import main
+from bench_replay import CASHIERS, UpdateFactory
+from fake_session import FakeTelegramSession
+
+UPDATES_PER_USER = 8
+MAX_LATENCY = 0.05
+
+
+class JitterSession(FakeTelegramSession):
+    """Answer after a random delay and track which chats have a request in flight."""
+
+    def __init__(self, seed):
+        super().__init__()
+        self.rng = random.Random(seed)
+        self.in_flight = {}
+        self.max_chats_in_flight = 0
+        self.slept = 0.0
+
+    async def make_request(self, bot, method, timeout=None):
+        chat_id = getattr(method, "chat_id", None)
+        self.in_flight[chat_id] = self.in_flight.get(chat_id, 0) + 1
+        self.max_chats_in_flight = max(self.max_chats_in_flight, len(self.in_flight))
+        delay = self.rng.uniform(0, MAX_LATENCY)
+        self.slept += delay
+        try:
+            await asyncio.sleep(delay)
+            return await super().make_request(bot, method, timeout)
+        finally:
+            self.in_flight[chat_id] -= 1
+            if not self.in_flight[chat_id]:
+                del self.in_flight[chat_id]
+
+
+def test_interleaved_users_keep_their_own_order(db):
+    session = JitterSession(seed=1)
+    factory = UpdateFactory()
+    dp = main.build_dispatcher()
+    bot = Bot("1:offline", session=session)
+    # Round-robin over cashiers, as updates arrive from a busy shop
+    updates = [(user, factory.command(user, f"/range 2025-01-0{day} 2025-01-0{day}"))
+               for day in range(1, UPDATES_PER_USER + 1) for user in CASHIERS]
+
+    async def replay():
+        started = time.perf_counter()
+        # Each update is its own task, as with handle_as_tasks=True polling
+        await asyncio.gather(*(dp.feed_update(bot, update) for _, update in updates))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(replay())
+
+    expected = [f"2025-01-0{day}" for day in range(1, UPDATES_PER_USER + 1)]
+    for user_id, _ in CASHIERS:
+        replies = [re.search(r"\d{4}-\d{2}-\d{2}", method.text).group()
+                   for method in session.sent("SendMessage") if method.chat_id == user_id]
+        assert replies == expected
+    # Different users were served at the same time, so the replay beats doing it in turn
+    assert session.max_chats_in_flight > 1
+    assert elapsed < session.slept * 0.6
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from fake_session import FakeTelegramSession
+from main import OutboundScheduler, get_main_keyboard
+
+
+def make_bot(latency=0.0, **limits):
+    session = FakeTelegramSession(latency=latency)
+    scheduler = OutboundScheduler(**limits)
+    session.middleware(scheduler)
+    return Bot("1:offline", session=session), session, scheduler
+
+
+def test_pacing_per_chat():
+    bot, session, _ = make_bot(chat_rate=10, chat_burst=2)
+
+    async def send():
+        start = time.monotonic()
+        await asyncio.gather(*(bot.send_message(1, f"#{i}") for i in range(6)),
+                             *(bot.send_message(2, f"#{i}") for i in range(2)))
+        return start
+
+    start = asyncio.run(send())
+    chat1 = [t - start for t, m in session.calls if m.chat_id == 1]
+    chat2 = [t - start for t, m in session.calls if m.chat_id == 2]
+    # Chat 1: a burst of 2, then 4 more at 10/s; chat 2 is not held up by it
+    assert 0.35 <= chat1[-1] < 0.6
+    assert chat2[-1] < 0.05
+
+
+def test_retry_after_is_honoured():
+    bot, session, _ = make_bot()
+    session.fail_next(lambda method: TelegramRetryAfter(method, "Too Many Requests", 1))
+    start = time.monotonic()
+    asyncio.run(bot.send_message(1, "after flood"))
+    assert 1.0 <= session.calls[-1][0] - start < 1.2
+    assert len(session.sent()) == 1
+
+
+def test_message_not_modified_counts_as_success():
+    bot, session, _ = make_bot()
+    session.fail_next(lambda method: TelegramBadRequest(
+        method, "Bad Request: message is not modified: specified new message content and "
+                "reply markup are exactly the same"))
+    assert asyncio.run(bot.edit_message_text("same", chat_id=1, message_id=5)) is True
+
+
+def test_identical_edits_are_skipped():
+    bot, session, scheduler = make_bot()
+    keyboard = get_main_keyboard(False)
+
+    async def edit():
+        message = await bot.send_message(1, "menu", reply_markup=keyboard)
+        for text in ("menu", "menu", "other"):
+            await bot.edit_message_text(text, chat_id=1, message_id=message.message_id, reply_markup=keyboard)
+
+    asyncio.run(edit())
+    assert len(session.sent("EditMessageText")) == 1
+    assert scheduler.skipped == 2
+
+
+def test_rapid_edits_are_coalesced():
+    bot, session, scheduler = make_bot(chat_rate=5, chat_burst=1)
+
+    async def edit():
+        await bot.send_message(1, "uses up the burst")
+        await asyncio.gather(*(bot.edit_message_text(f"step {i}", chat_id=1, message_id=7) for i in range(5)))
+
+    asyncio.run(edit())
+    assert [m.text for m in session.sent("EditMessageText")] == ["step 4"]
+    assert scheduler.coalesced == 4
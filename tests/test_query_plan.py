@@ -0,0 +1,64 @@
+import re
+from datetime import datetime, timedelta
+
+import main
+
+TS_FILTER = re.compile(r"\bts\s*[<>]")
+SALES_SCAN = re.compile(r"^SCAN (main\.)?(sales|s)\b")
+# Deleting archived rows looks them up by id, which beats the time index
+SALES_SEARCH = re.compile(r"^SEARCH (main\.)?(sales|s) USING (INDEX idx_sales_ts|COVERING INDEX idx_sales_ts|INTEGER PRIMARY KEY)")
+
+
+def add_sales(moments):
+    main.record_sales([main.make_sale_row("อเมริกาโน่ / Americano", "กาแฟ / Coffee", "M", 60, "cash", moment)
+                       for moment in moments])
+
+
+def traced(conn, func, *args):
+    """Statements func runs on conn that filter sales by time, with their parameters filled in."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func(*args)
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if "sales" in sql and TS_FILTER.search(sql)]
+
+
+def assert_uses_ts_index(conn, statements):
+    assert statements
+    for sql in statements:
+        details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        # Scanning a subquery result (rows already picked by time) is fine
+        subqueries = {detail.split()[1] for detail in details if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+        scans = [detail for detail in details
+                 if SALES_SCAN.match(detail) and SALES_SCAN.match(detail).group(2) not in subqueries]
+        assert any(SALES_SEARCH.match(detail) for detail in details), (sql, details)
+        assert not scans, (sql, details)
+
+
+def test_quick_sales_window_uses_ts_index(db):
+    add_sales([datetime.now() - timedelta(days=day) for day in range(60)])
+    assert_uses_ts_index(db, traced(db, main.quick_sales.load, db))
+
+
+def test_export_range_uses_ts_index(db, tmp_path):
+    add_sales([datetime(2025, 1, day, 10) for day in range(1, 29)])
+    statements = traced(db, main.export_sales, str(tmp_path / "out.csv"), "2025-01-05", "2025-01-10")
+    assert_uses_ts_index(db, statements)
+
+
+def test_archive_month_bounds_use_ts_index(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    old = datetime.now().replace(day=15) - timedelta(days=365)
+    add_sales([old + timedelta(hours=hour) for hour in range(48)] + [datetime.now()])
+    statements = traced(db, main.archive_closed_months, 2)
+    # Exporting an archived month reads the archive and the live table by time
+    statements += traced(db, main.export_sales, str(tmp_path / "out.csv"),
+                         old.strftime("%Y-%m-%d"), old.strftime("%Y-%m-%d"))
+    assert [month for month, *_ in main.list_partitions()] == [old.strftime("%Y-%m")]
+    main._attach_archive(db, old.strftime("%Y-%m"), read_only=False)
+    try:
+        assert_uses_ts_index(db, statements)
+    finally:
+        db.execute("DETACH DATABASE archive")
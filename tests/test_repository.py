@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from aiogram import Bot
+
+import main
+from bench_replay import UpdateFactory
+from fake_session import FakeTelegramSession
+
+SLOW_QUERY_SECONDS = 0.5
+
+
+def test_updates_are_handled_while_a_slow_query_runs(db, monkeypatch):
+    get_today_report = main.get_today_report
+
+    def slow_today_report():
+        time.sleep(SLOW_QUERY_SECONDS)
+        return get_today_report()
+
+    monkeypatch.setattr(main, "get_today_report", slow_today_report)
+
+    async def replay():
+        dp = main.build_dispatcher()
+        bot = Bot("1:offline", session=FakeTelegramSession())
+        factory = UpdateFactory()
+        finished = {}
+        started = time.perf_counter()
+
+        async def feed(name, update):
+            await dp.feed_update(bot, update)
+            finished[name] = time.perf_counter() - started
+
+        await asyncio.gather(
+            feed("report", factory.command((101, "dkokhel"), "/report")),
+            feed("start", factory.command((102, "nangsihalath"), "/start")),
+            feed("week", factory.command((103, "dkokhel"), "/week")),
+        )
+        return finished
+
+    finished = asyncio.run(replay())
+    assert finished["report"] >= SLOW_QUERY_SECONDS
+    # Neither the event loop nor the whole reader pool waits for the slow report
+    assert finished["start"] < SLOW_QUERY_SECONDS / 2
+    assert finished["week"] < SLOW_QUERY_SECONDS / 2
@@ -0,0 +1,18 @@
+import main
+from bench_replay import UpdateFactory
+
+
+def test_pay_accepts_only_known_payment_types():
+    for payment_type in main.PAYMENT_TYPES:
+        route, payload = main.resolve_callback(f"pay:{payment_type}")
+        assert route.handler is main.cb_pay and payload == payment_type
+    assert main.resolve_callback("pay:bitcoin") == (None, None)
+    assert main.resolve_callback("pay:") == (None, None)
+    assert main.resolve_callback("ipay:0:0:0:bitcoin") == (None, None)
+
+
+def test_update_route_of_blank_commands():
+    factory = UpdateFactory()
+    for text in ("/", "/ \n", "/　"):
+        assert main.update_route(factory.command((101, "dkokhel"), text)) == "message"
+    assert main.update_route(factory.command((101, "dkokhel"), "/stats@bot")) == "/stats"
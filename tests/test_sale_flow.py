@@ -0,0 +1,36 @@
+import asyncio
+
+from aiogram import Bot
+
+import main
+from bench_replay import UpdateFactory
+from fake_session import FakeTelegramSession
+
+CASHIER = (101, "dkokhel")
+
+
+def tap(*callbacks):
+    """Feed callback taps from one cashier; returns the texts the bot edited in."""
+    factory = UpdateFactory()
+    dp = main.build_dispatcher()
+    session = FakeTelegramSession()
+    bot = Bot("1:offline", session=session)
+
+    async def run():
+        for data in callbacks:
+            await dp.feed_update(bot, factory.callback(CASHIER, data))
+
+    asyncio.run(run())
+    return [method.text for method in session.sent("EditMessageText")]
+
+
+def test_size_after_changing_category_goes_back_to_categories(db):
+    texts = tap("new_sale", "cat:0", "drink:12", "back_to_category", "cat:1", "size:0")
+    assert "Step 1: Choose category" in texts[-1]
+    assert main.get_session(CASHIER[0]).items == []
+
+
+def test_out_of_range_size_goes_back_to_categories(db):
+    texts = tap("new_sale", "cat:0", "drink:12", "size:99")
+    assert "Step 1: Choose category" in texts[-1]
+    assert main.get_session(CASHIER[0]).items == []
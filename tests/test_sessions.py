@@ -0,0 +1,37 @@
+import main
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def test_reading_a_session_keeps_it_alive_across_restarts(monkeypatch):
+    clock = Clock(1_000_000.0)
+    monkeypatch.setattr(main.time, "time", clock.time)
+    stored = {}
+
+    def persist(user_id, session):
+        stored[user_id] = None if session is None else (
+            session.category, session.drink, session.items, session.touched, session.sale_key)
+
+    store = main.SessionStore(ttl=1800)
+    store.persist = persist
+    store.get(7).category = 1
+    store.save(7)
+
+    clock.now += main.SESSION_TOUCH_SAVE_SECONDS / 2
+    store.get(7)  # only looked at: too soon to write again
+    assert stored[7][3] == 1_000_000.0
+
+    clock.now += 1500  # read again well within the TTL, without changing it
+    store.get(7)
+    assert stored[7][3] == clock.now
+
+    clock.now += 1000  # past the TTL of the first save, but not of the last read
+    restarted = main.SessionStore(ttl=1800)
+    restarted.load([(user_id, *values) for user_id, values in stored.items()])
+    assert restarted.get(7).category == 1
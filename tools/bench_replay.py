@@ -0,0 +1,243 @@
+"""
+Offline replay benchmark
+========================
+Feeds a synthetic shop day through the real Dispatcher from main.py, with
+an offline Bot session and a temporary database, and reports:
+
+- handler latency per update (p50/p95/p99) by kind of update,
+- updates per second with several cashiers tapping at once,
+- time spent inside SQLite (on the DB threads),
+- the all-time report and details at 10k, 100k and 1M stored sales,
+  uncached (straight from the DB) and through the report cache.
+
+Outgoing requests are answered instantly and are not rate limited, so the
+numbers are the bot's own cost. Nothing touches the real database.
+
+Run from the repository root:
+    python tools/bench_replay.py
+    python tools/bench_replay.py --flows 500 --sizes 10000   # quick run
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import main  # noqa: E402
+from fake_session import FakeTelegramSession  # noqa: E402
+
+CASHIERS = [(101, "dkokhel"), (102, "nangsihalath"), (103, "dkokhel")]
+REPORT_TAPS = ["today_report", "admin_menu", "week_report", "details:today", "back_to_main"]
+
+
+class UpdateFactory:
+    """Build Telegram updates the way the bot receives them."""
+
+    def __init__(self):
+        self.update_id = 0
+
+    def _next(self):
+        self.update_id += 1
+        return self.update_id
+
+    def callback(self, user, data):
+        user_id, username = user
+        update_id = self._next()
+        return Update.model_validate({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "data": data, "chat_instance": "1",
+            "from": {"id": user_id, "is_bot": False, "first_name": "Cashier", "username": username},
+            "message": {"message_id": 10, "date": int(time.time()), "text": "menu",
+                        "chat": {"id": user_id, "type": "private"},
+                        "from": {"id": 1, "is_bot": True, "first_name": "Bot"}}}})
+
+    def command(self, user, text):
+        user_id, username = user
+        update_id = self._next()
+        return Update.model_validate({"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Cashier", "username": username}}})
+
+
+def random_sale_taps(rng):
+    """Callback data of one complete sale, picked from the compiled menu."""
+    cat_idx = rng.randrange(len(main.MENU_INDEX))
+    category = main.MENU_INDEX[cat_idx]
+    drink_idx = rng.randrange(len(category.drinks))
+    size_idx = rng.randrange(len(category.drinks[drink_idx].sizes))
+    return ["new_sale", f"cat:{cat_idx}", f"drink:{drink_idx}", f"size:{size_idx}",
+            f"pay:{rng.choice(main.PAYMENT_TYPES)}"]
+
+
+def make_day(flows, rng, factory):
+    """Per-cashier update lists: sale flows with report taps and commands mixed in."""
+    scripts = {user: [] for user in CASHIERS}
+    for _ in range(flows):
+        user = rng.choice(CASHIERS)
+        for data in random_sale_taps(rng):
+            scripts[user].append(("callback", factory.callback(user, data)))
+        roll = rng.random()
+        if roll < 0.08:
+            scripts[user].append(("report", factory.callback(user, rng.choice(REPORT_TAPS))))
+        elif roll < 0.10:
+            scripts[user].append(("command", factory.command(user, rng.choice(["/report", "/start", "/week"]))))
+    return scripts
+
+
+class DbTimer:
+    """Add up the time DB helpers spend on the repository's worker threads."""
+
+    def __init__(self, repository):
+        self.total = 0.0
+        self.calls = 0
+        write, read = repository._write, repository._read
+        repository._write = lambda func, *args: write(self._timed(func), *args)
+        repository._read = lambda func, *args: read(self._timed(func), *args)
+
+    def _timed(self, func):
+        def run(*args):
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.total += time.perf_counter() - started
+                self.calls += 1
+        return run
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def print_latency(title, samples):
+    print(f"  {title:<10} n={len(samples):<6} p50={percentile(samples, 50) * 1000:7.3f} ms"
+          f"  p95={percentile(samples, 95) * 1000:7.3f} ms  p99={percentile(samples, 99) * 1000:7.3f} ms")
+
+
+def reset_report_cache():
+    main.report_cache = main.ReportCache()
+
+
+def use_database(path):
+    main.DB_PATH = path
+    reset_report_cache()
+    main.init_database()
+
+
+async def replay_day(flows, seed):
+    rng = random.Random(seed)
+    factory = UpdateFactory()
+    dp = main.build_dispatcher()
+    bot = Bot("1:offline", session=FakeTelegramSession())
+    scripts = make_day(flows, rng, factory)
+    latencies = {"callback": [], "report": [], "command": []}
+    timer = DbTimer(main.sales_db)
+
+    async def cashier(updates):
+        for kind, update in updates:
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(cashier(updates) for updates in scripts.values()))
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"Synthetic day: {flows} sales by {len(CASHIERS)} cashiers, {total} updates")
+    for kind, samples in latencies.items():
+        if samples:
+            print_latency(kind, samples)
+    print_latency("all", [s for samples in latencies.values() for s in samples])
+    print(f"  throughput {total / elapsed:,.0f} updates/s ({elapsed:.2f} s wall)")
+    print(f"  SQLite     {timer.total:.2f} s in {timer.calls} calls "
+          f"({timer.total / elapsed:.0%} of wall time)")
+    sales = main.db_pool.connection().execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+    assert sales == flows, f"expected {flows} sales, found {sales}"
+
+
+def fill_sales(count, seed):
+    """Store `count` random sales spread over the last year."""
+    rng = random.Random(seed)
+    choices = [(category.name, drink.name, size, price)
+               for category in main.MENU_INDEX for drink in category.drinks
+               for size, price in zip(drink.sizes, drink.prices)]
+    start = datetime.now() - timedelta(days=365)
+    batch = []
+    for i in range(count):
+        category, drink, size, price = rng.choice(choices)
+        moment = start + timedelta(seconds=rng.randrange(365 * 86400))
+        batch.append(main.make_sale_row(drink, category, size, price, rng.choice(main.PAYMENT_TYPES), moment))
+        if len(batch) == 10000 or i == count - 1:
+            main.record_sales(batch)
+            batch = []
+
+
+def time_call(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+async def bench_alltime(sizes, seed, workdir):
+    print("All-time report by stored sales")
+    for size in sizes:
+        use_database(os.path.join(workdir, f"alltime_{size}.db"))
+        started = time.perf_counter()
+        fill_sales(size, seed)
+        fill = time.perf_counter() - started
+
+        report = time_call(main.get_alltime_report, 20)
+        first_day, last_day, _, _ = main.get_alltime_report()
+        details = time_call(lambda: main.get_sales_details(first_day, last_day), 20)
+
+        async def render(details_view):
+            reset_report_cache()
+            started = time.perf_counter()
+            await main.render_report("alltime", True, details=details_view)
+            cold = time.perf_counter() - started
+            started = time.perf_counter()
+            for _ in range(100):
+                await main.render_report("alltime", True, details=details_view)
+            return cold, (time.perf_counter() - started) / 100
+
+        cold, warm = await render(False)
+        details_cold, details_warm = await render(True)
+        print(f"  {size:>9,} rows (filled in {fill:5.1f} s)")
+        print(f"    report   query {report * 1000:7.3f} ms, rendered {cold * 1000:7.3f} ms, cached {warm * 1e6:6.1f} us")
+        print(f"    details  query {details * 1000:7.3f} ms, rendered {details_cold * 1000:7.3f} ms, "
+              f"cached {details_warm * 1e6:6.1f} us")
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        use_database(os.path.join(workdir, "day.db"))
+        await replay_day(args.flows, args.seed)
+        print()
+        await bench_alltime(args.sizes, args.seed, workdir)
+        main.sales_db.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a synthetic day through the bot")
+    parser.add_argument("--flows", type=int, default=3000, help="complete sales in the day")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="stored sales for the all-time report")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,87 @@
+"""
+Callback routing micro-benchmark
+================================
+Compares the cost of picking a handler for a callback_data string with the
+old if-chain in callback_handler against the routing table in main.py.
+Only the dispatch decision is timed, not the handlers themselves.
+
+Run from the repository root:
+    python tools/bench_routing.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import resolve_callback  # noqa: E402
+
+
+def if_chain(data):
+    """The comparisons the old callback_handler made, in the same order."""
+    if data == "new_sale":
+        return "new_sale"
+    if data == "today_report":
+        return "today_report"
+    if data == "week_report":
+        return "week_report"
+    if data == "month_report":
+        return "month_report"
+    if data == "alltime_report":
+        return "alltime_report"
+    if data == "admin_menu":
+        return "admin_menu"
+    if data == "back_to_main":
+        return "back_to_main"
+    if data == "cancel":
+        return "cancel"
+    if data == "details:today":
+        return "details:today"
+    if data == "details:week":
+        return "details:week"
+    if data == "details:month":
+        return "details:month"
+    if data == "details:alltime":
+        return "details:alltime"
+    if data.startswith("cat:"):
+        return int(data.split(":", 1)[1])
+    if data.startswith("drink:"):
+        return int(data.split(":", 1)[1])
+    if data.startswith("size:"):
+        return int(data.split(":", 1)[1])
+    if data.startswith("pay:"):
+        return data.split(":", 1)[1]
+    if data == "back_to_category":
+        return "back_to_category"
+    if data == "back_to_drink":
+        return "back_to_drink"
+    return None
+
+
+# One typical sale flow plus an occasional report tap.
+WORKLOAD = ["new_sale", "cat:1", "drink:3", "size:1", "pay:cash", "today_report", "back_to_drink"]
+
+
+def bench(func, number):
+    def run():
+        for data in WORKLOAD:
+            func(data)
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return best / (number * len(WORKLOAD)) * 1e9
+
+
+def main():
+    number = 200_000
+    print(f"{'callback':<16}{'if-chain ns':>14}{'router ns':>12}")
+    for data in WORKLOAD:
+        before = min(timeit.repeat(lambda: if_chain(data), number=number, repeat=5)) / number * 1e9
+        after = min(timeit.repeat(lambda: resolve_callback(data), number=number, repeat=5)) / number * 1e9
+        print(f"{data:<16}{before:>14.1f}{after:>12.1f}")
+    before = bench(if_chain, number // 10)
+    after = bench(resolve_callback, number // 10)
+    print(f"{'mixed workload':<16}{before:>14.1f}{after:>12.1f}   ({before / after:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
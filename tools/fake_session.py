@@ -0,0 +1,65 @@
+"""
+Offline Telegram session
+========================
+A Bot session that answers every request locally instead of calling the
+Telegram API. It records what was sent (with timestamps) and can be told to
+fail upcoming requests, which is enough to exercise OutboundScheduler and
+the handlers without a network or a bot token:
+
+    session = FakeTelegramSession(latency=0.01)
+    session.fail_next(lambda method: TelegramRetryAfter(method, "Too Many Requests", 1))
+    bot = Bot("1:offline", session=session)
+"""
+
+import asyncio
+import time
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+
+class FakeTelegramSession(BaseSession):
+    """Record outgoing requests and return plausible results."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = []  # (monotonic time, method)
+        self._failures = []
+        self._next_message_id = 1000
+
+    def fail_next(self, make_error):
+        """Raise make_error(method) for the next request instead of answering it."""
+        self._failures.append(make_error)
+
+    def sent(self, method_name=None):
+        """Methods sent so far, optionally only those of one type."""
+        return [method for _, method in self.calls
+                if method_name is None or type(method).__name__ == method_name]
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._failures:
+            raise self._failures.pop(0)(method)
+        self.calls.append((time.monotonic(), method))
+        if method.__returning__ is bool:
+            return True
+        if hasattr(method, "text"):
+            message_id = getattr(method, "message_id", None)
+            if message_id is None:
+                self._next_message_id += 1
+                message_id = self._next_message_id
+            return Message(
+                message_id=message_id,
+                date=int(time.time()),
+                chat=Chat(id=method.chat_id or 0, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
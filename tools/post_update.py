@@ -0,0 +1,61 @@
+"""
+Post recorded updates to a local webhook
+========================================
+Sends Telegram update JSON to the bot's webhook server the way Telegram
+does, including the secret token header, and prints each response.
+
+Start the bot in webhook mode with a known secret, then post updates:
+    WEBHOOK_SECRET=dev python main.py --mode webhook --port 8080
+    python tools/post_update.py tools/updates/sale_flow.jsonl --secret dev
+
+A file may hold one update, a JSON list of updates, or one update per line.
+The sender usernames must be in ALLOWED_USERS for the handlers to run.
+Replies go to the real Telegram API, so with a dummy token they fail after
+the update was processed (sales are still recorded).
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    if "\n" in text and not text.startswith("{\n"):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [json.loads(text)]
+
+
+async def post_all(url, secret, paths, delay):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    async with aiohttp.ClientSession() as session:
+        for path in paths:
+            for update in load_updates(path):
+                started = time.perf_counter()
+                async with session.post(url, json=update, headers=headers) as response:
+                    body = await response.text()
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"update {update.get('update_id')}: HTTP {response.status} "
+                      f"in {elapsed:.1f} ms {body[:80]}")
+                if delay:
+                    await asyncio.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("files", nargs="+", help="update JSON files")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="", help="WEBHOOK_SECRET of the running bot")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds between updates")
+    args = parser.parse_args()
+    asyncio.run(post_all(args.url, args.secret, args.files, args.delay))
+
+
+if __name__ == "__main__":
+    main()